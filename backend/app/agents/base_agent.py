@@ -3,38 +3,70 @@ Base Agent Class with Message Bus Integration
 All agents inherit from this to enable communication
 """
 
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterable, Tuple
 from abc import ABC, abstractmethod
-from .message_bus import MessageBus, AgentMessage, MessageType
+from .message_bus import (
+    MessageBus, AgentMessage, MessageType, Subscription, ALL_MESSAGES, DEFAULT_REQUEST_TIMEOUT
+)
+from app.logging_config import get_logger
 from datetime import datetime
+import asyncio
 
 
 class BaseAgent(ABC):
     """Base class for all agents with communication capabilities"""
     
+    # Messages this agent handles; the bus only delivers matching messages.
+    # Subclasses narrow this to what their process_message actually uses.
+    subscriptions: Tuple[Subscription, ...] = ALL_MESSAGES
+    
     def __init__(self, agent_id: str, message_bus: MessageBus):
         self.agent_id = agent_id
         self.message_bus = message_bus
         self.last_message_check = datetime.now()
         self.internal_state = {}  # For storing agent's internal state
+        self.logger = get_logger(f"agents.{agent_id}")
+        
+        # Push delivery: the bus fills the inbox, the dispatcher drains it
+        self.inbox: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        message_bus.register(self)
         
-    def broadcast(self, message_type: MessageType, content: Dict[str, Any]) -> AgentMessage:
+    def broadcast(self, message_type: MessageType, content: Dict[str, Any],
+                  tags: Iterable[str] = ()) -> AgentMessage:
         """Send a message to all agents"""
         return self.message_bus.broadcast(
             sender=self.agent_id,
             message_type=message_type,
-            content=content
+            content=content,
+            tags=tags
         )
     
     def send_to(self, receiver: str, message_type: MessageType, 
-                content: Dict[str, Any], in_reply_to: Optional[str] = None) -> AgentMessage:
+                content: Dict[str, Any], in_reply_to: Optional[str] = None,
+                tags: Iterable[str] = ()) -> AgentMessage:
         """Send a direct message to another agent"""
         return self.message_bus.send_to(
             sender=self.agent_id,
             receiver=receiver,
             message_type=message_type,
             content=content,
-            in_reply_to=in_reply_to
+            in_reply_to=in_reply_to,
+            tags=tags
+        )
+    
+    async def request(self, receiver: str, content: Dict[str, Any],
+                      message_type: MessageType = MessageType.QUERY,
+                      timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                      tags: Iterable[str] = ()) -> AgentMessage:
+        """Send a message to another agent and await its reply (raises RequestTimeout)"""
+        return await self.message_bus.request(
+            sender=self.agent_id,
+            receiver=receiver,
+            content=content,
+            message_type=message_type,
+            timeout=timeout,
+            tags=tags
         )
     
     def get_messages(self, message_type: Optional[MessageType] = None) -> List[AgentMessage]:
@@ -64,9 +96,56 @@ class BaseAgent(ABC):
         """
         pass
     
+    def start_dispatcher(self) -> None:
+        """Create the inbox queue and dispatcher task on the running loop"""
+        self.stop_dispatcher()
+        self.inbox = asyncio.Queue()
+        self._dispatcher = asyncio.get_running_loop().create_task(
+            self._dispatch_loop(), name=f"dispatch-{self.agent_id}"
+        )
+    
+    def stop_dispatcher(self) -> None:
+        """Cancel the dispatcher task, if one is running"""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            self._dispatcher.cancel()
+        self._dispatcher = None
+    
+    def is_dispatching(self) -> bool:
+        """True when pushed messages are being processed by the dispatcher"""
+        return self._dispatcher is not None and not self._dispatcher.done() \
+            and self.message_bus._delivery_active()
+    
+    async def _dispatch_loop(self) -> None:
+        """Process pushed messages as soon as they arrive"""
+        while True:
+            message = await self.inbox.get()
+            cancelled = False
+            try:
+                await self.process_message(message)
+            except asyncio.CancelledError:
+                cancelled = True  # stop_delivery() has already written this delivery off
+                raise
+            except Exception:
+                self.logger.exception("Error processing %s from %s", message.message_type.value, message.sender)
+            finally:
+                # Keep the polling cursor in step so nothing is processed twice
+                if message.timestamp > self.last_message_check:
+                    self.last_message_check = message.timestamp
+                self.inbox.task_done()
+                if not cancelled:
+                    self.message_bus._mark_delivered(message)
+    
     async def check_and_process_messages(self) -> List[AgentMessage]:
         """Check for new messages and process them"""
-        messages = self.get_messages()
+        if self.is_dispatching():
+            # Messages are pushed to the dispatcher; just wait for it to catch up
+            await self.message_bus.drain()
+            return []
+        
+        messages = [
+            m for m in self.get_messages()
+            if self.message_bus.is_subscribed(self.agent_id, m)
+        ]
         responses = []
         
         for msg in messages:
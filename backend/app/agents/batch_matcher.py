@@ -0,0 +1,287 @@
+"""
+Batch pairing over the whole waiting pool
+Instead of giving one requester their best peer, pairs everyone waiting at
+once so a strong match for one person isn't taken by someone who had
+alternatives
+
+Pairing: every eligible peer is scored against every other with the 80/20
+engine (in row blocks, so memory stays O(block x pool)). Each score is
+weighted by the pair's mean urgency, and the top-k edges per peer are kept.
+A greedy maximum-weight matching over those edges (heaviest first, both
+ends unmatched) picks the pairs, with further rounds over whoever is left.
+Greedy matching is within a factor of two of the optimum and runs in
+O(pool x k log) rather than the cubic time of an exact blossom/Hungarian
+solve, which is what keeps pools of thousands within seconds.
+
+Review: each pair is broadcast as a PROPOSAL on a session bus, where a
+SafetyAgent reviews it exactly as it reviews per-request matches; pairs it
+objects to are dropped from the result.
+
+Environment:
+    BATCH_MATCH_INTERVAL    Seconds between scheduled runs (default 0 = only on demand)
+    BATCH_MATCH_TOP_K       Candidate edges kept per peer (default 10)
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from .base_agent import BaseAgent
+from .message_bus import MessageBus, MessageType, Subscription, TAG_SAFETY_OBJECTION
+from .safety_agent import SafetyAgent
+from .scoring import ScoringEngine, combine, MIN_MATCH_SCORE
+
+BATCH_INTERVAL = float(os.getenv("BATCH_MATCH_INTERVAL", "0"))
+BATCH_TOP_K = int(os.getenv("BATCH_MATCH_TOP_K", "10"))
+
+URGENCY_WEIGHTS = {"LOW": 0.8, "MODERATE": 1.0, "HIGH": 1.5}  # CRISIS is never batch-paired
+RISK_ORDER = ("LOW", "MODERATE", "HIGH")
+BLOCK_ROWS = 1024
+MAX_ROUNDS = 3
+
+
+@dataclass
+class ProposedPair:
+    user_a: str
+    user_b: str
+    match_score: int
+    mood_similarity_score: int
+    profile_compatibility_score: int
+    weight: float
+    risk_level: str
+    proposal_id: Optional[str] = None
+    objection: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "user_a": self.user_a,
+            "user_b": self.user_b,
+            "match_score": self.match_score,
+            "mood_similarity_score": self.mood_similarity_score,
+            "profile_compatibility_score": self.profile_compatibility_score,
+            "urgency_weighted_score": round(self.weight, 1),
+            "risk_level": self.risk_level,
+            **({"objection": self.objection} if self.objection else {})
+        }
+
+
+@dataclass
+class BatchReport:
+    pool_size: int
+    eligible: int
+    pairs: List[ProposedPair] = field(default_factory=list)
+    rounds: int = 0
+    pairing_ms: float = 0.0   # feature sync, block scoring and greedy matching
+    review_ms: float = 0.0    # PROPOSAL broadcast and SafetyAgent review
+    total_ms: float = 0.0
+
+    @property
+    def accepted(self) -> List[ProposedPair]:
+        return [p for p in self.pairs if p.objection is None]
+
+    def as_dict(self, include_pairs: bool = True) -> Dict[str, Any]:
+        accepted = self.accepted
+        seconds = self.total_ms / 1000
+        report = {
+            "pool_size": self.pool_size,
+            "eligible": self.eligible,
+            "pairs_proposed": len(self.pairs),
+            "pairs_accepted": len(accepted),
+            "safety_objections": len(self.pairs) - len(accepted),
+            "unmatched": self.eligible - 2 * len(accepted),  # includes both peers of an objected pair
+            "rounds": self.rounds,
+            "mean_match_score": round(float(np.mean([p.match_score for p in accepted])), 1) if accepted else 0.0,
+            "timings_ms": {
+                "pairing": round(self.pairing_ms, 1),
+                "review": round(self.review_ms, 1),
+                "total": round(self.total_ms, 1)
+            },
+            "throughput": {
+                "users_per_second": round(self.eligible / seconds, 1) if seconds else 0.0,
+                "pairs_per_second": round(len(self.pairs) / seconds, 1) if seconds else 0.0
+            }
+        }
+        if include_pairs:
+            report["pairs"] = [p.as_dict() for p in accepted]
+        return report
+
+
+def top_edges(mood: np.ndarray, profile: np.ndarray, urgency: np.ndarray, k: int,
+              min_score: float, block: int = BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Best `k` urgency-weighted edges per row as (i, j, weight) arrays, i < j
+
+    Pairs scoring below `min_score` (before weighting) are never edges.
+    """
+    n = len(mood)
+    k = min(k, n - 1)
+    if k < 1:
+        return np.empty(0, np.intp), np.empty(0, np.intp), np.empty(0, np.float32)
+    heads, tails, weights = [], [], []
+    for start in range(0, n, block):
+        stop = min(n, start + block)
+        final, _, _ = combine(mood[start:stop] @ mood.T, profile[start:stop] @ profile.T)
+        final[np.arange(stop - start), np.arange(start, stop)] = -np.inf  # no self pairs
+        final[final < min_score] = -np.inf
+        final *= (urgency[start:stop, None] + urgency[None, :]) / 2
+        nbrs = np.argpartition(-final, k - 1, axis=1)[:, :k]
+        heads.append(np.repeat(np.arange(start, stop), k))
+        tails.append(nbrs.ravel())
+        weights.append(np.take_along_axis(final, nbrs, axis=1).ravel())
+    i, j, w = np.concatenate(heads), np.concatenate(tails), np.concatenate(weights)
+    keep = np.isfinite(w)
+    i, j, w = i[keep], j[keep], w[keep]
+    # Each edge can be found from both ends; keep one copy
+    a, b = np.minimum(i, j), np.maximum(i, j)
+    _, first = np.unique(a * n + b, return_index=True)
+    return a[first], b[first], w[first]
+
+
+def greedy_matching(n: int, i: np.ndarray, j: np.ndarray, w: np.ndarray,
+                    matched: Optional[np.ndarray] = None) -> List[Tuple[int, int, float]]:
+    """Heaviest-first matching over the given edges; updates `matched` in place"""
+    matched = np.zeros(n, dtype=bool) if matched is None else matched
+    taken = set(np.flatnonzero(matched).tolist())
+    pairs = []
+    order = np.argsort(-w, kind="stable")
+    for a, b, weight in zip(i[order].tolist(), j[order].tolist(), w[order].tolist()):
+        if a not in taken and b not in taken:
+            taken.update((a, b))
+            pairs.append((a, b, weight))
+    matched[list(taken)] = True
+    return pairs
+
+
+def pair_features(mood: np.ndarray, profile: np.ndarray, urgency: np.ndarray, k: int = BATCH_TOP_K,
+                  min_score: float = MIN_MATCH_SCORE) -> Tuple[List[Tuple[int, int, float]], int]:
+    """Pair row indices of the feature matrices; returns (pairs, rounds used)"""
+    n = len(mood)
+    matched = np.zeros(n, dtype=bool)
+    pairs: List[Tuple[int, int, float]] = []
+    rounds = 0
+    remaining = np.arange(n)
+    while len(remaining) > 1 and rounds < MAX_ROUNDS:
+        rounds += 1
+        i, j, w = top_edges(mood[remaining], profile[remaining], urgency[remaining], k, min_score)
+        found = greedy_matching(n, remaining[i], remaining[j], w, matched)
+        if not found:
+            break
+        pairs.extend(found)
+        remaining = np.flatnonzero(~matched)
+    return pairs, rounds
+
+
+def _higher_risk(a: str, b: str) -> str:
+    rank = {level: n for n, level in enumerate(RISK_ORDER)}
+    return a if rank.get(a, 1) >= rank.get(b, 1) else b
+
+
+class BatchMatcher(BaseAgent):
+    """Pairs the waiting pool and puts each pair through SafetyAgent review"""
+
+    # Only needs SafetyAgent's objections, to tie them back to proposals
+    subscriptions = (Subscription(message_types=frozenset({MessageType.NOTIFICATION}),
+                                  topics=frozenset({TAG_SAFETY_OBJECTION})),)
+
+    def __init__(self, message_bus: MessageBus, scorer: ScoringEngine,
+                 top_k: int = BATCH_TOP_K, min_score: int = MIN_MATCH_SCORE):
+        super().__init__("BatchMatcher", message_bus)
+        self.scorer = scorer
+        self.top_k = top_k
+        self.min_score = min_score
+        self.objections: Dict[str, str] = {}  # proposal message_id -> reason
+
+    async def process_message(self, message):
+        proposal_id = message.content.get("proposal_id")
+        if proposal_id:
+            self.objections[proposal_id] = message.content.get("reason", "")
+        return None
+
+    async def run(self, pool: Dict[str, Dict[str, Any]]) -> BatchReport:
+        """Pair everyone in `pool` (user_id -> waiting entry) and review the pairs"""
+        begin = time.perf_counter()
+        eligible = [
+            (user_id, entry) for user_id, entry in pool.items()
+            if (entry.get("mood_analysis") or {}).get("urgency_level", "MODERATE") != "CRISIS"
+        ]
+        report = BatchReport(pool_size=len(pool), eligible=len(eligible))
+        if len(eligible) < 2:
+            report.total_ms = (time.perf_counter() - begin) * 1000
+            return report
+
+        # Feature rows are synced on the loop (the engine isn't thread-safe); the
+        # block scoring and matching work on copies in a worker thread
+        ids = [user_id for user_id, _ in eligible]
+        rows = self.scorer.sync({"user_id": user_id, **entry} for user_id, entry in eligible)
+        mood, profile = self.scorer.features(rows)
+        levels = [(entry.get("mood_analysis") or {}).get("urgency_level", "MODERATE") for _, entry in eligible]
+        urgency = np.array([URGENCY_WEIGHTS.get(level, 1.0) for level in levels], dtype=np.float32)
+
+        raw_pairs, report.rounds = await asyncio.to_thread(
+            pair_features, mood, profile, urgency, self.top_k, self.min_score
+        )
+        if raw_pairs:
+            a = np.array([p[0] for p in raw_pairs])
+            b = np.array([p[1] for p in raw_pairs])
+            final, mood_sim, profile_sim = combine(
+                np.einsum("nd,nd->n", mood[a], mood[b]), np.einsum("nd,nd->n", profile[a], profile[b])
+            )
+            for n, (x, y, weight) in enumerate(raw_pairs):
+                report.pairs.append(ProposedPair(
+                    ids[x], ids[y], int(round(float(final[n]))), int(round(float(mood_sim[n]))),
+                    int(round(float(profile_sim[n]))), weight, _higher_risk(levels[x], levels[y])
+                ))
+        report.pairing_ms = (time.perf_counter() - begin) * 1000
+
+        review_started = time.perf_counter()
+        await self._review(report.pairs)
+        report.review_ms = (time.perf_counter() - review_started) * 1000
+        report.total_ms = (time.perf_counter() - begin) * 1000
+
+        self.logger.info(
+            "🧮 Batch paired %d of %d eligible peers: %d pairs, %d objections, %.0f ms (%.0f users/s)",
+            2 * len(report.pairs), report.eligible, len(report.pairs), len(report.pairs) - len(report.accepted),
+            report.total_ms, report.as_dict(include_pairs=False)["throughput"]["users_per_second"]
+        )
+        return report
+
+    async def _review(self, pairs: List[ProposedPair]) -> None:
+        """Broadcast every pair as a PROPOSAL and wait for SafetyAgent to review them all"""
+        await self.message_bus.start_delivery()
+        for pair in pairs:
+            message = self.broadcast(
+                MessageType.PROPOSAL,
+                {
+                    "summary": f"Batch pairing: {pair.user_a} + {pair.user_b} ({pair.match_score}% score)",
+                    "match": {
+                        "user_id": pair.user_a,
+                        "matched_peer_id": pair.user_b,
+                        "match_score": pair.match_score,
+                        "mood_similarity_score": pair.mood_similarity_score,
+                        "profile_compatibility_score": pair.profile_compatibility_score,
+                        "risk_level": pair.risk_level
+                    },
+                    "rationale": "Global batch pairing (urgency-weighted)",
+                    "batch": True
+                }
+            )
+            pair.proposal_id = message.message_id
+        await self.message_bus.drain()
+        for pair in pairs:
+            pair.objection = self.objections.get(pair.proposal_id)
+
+
+async def run_batch(message_bus: MessageBus, scorer: ScoringEngine, pool: Dict[str, Dict[str, Any]],
+                    **options) -> BatchReport:
+    """One batch run on a fresh session bus with its own SafetyAgent"""
+    session_bus = message_bus.session()
+    SafetyAgent(session_bus)
+    matcher = BatchMatcher(session_bus, scorer, **options)
+    try:
+        return await matcher.run(pool)
+    finally:
+        session_bus.stop_delivery()
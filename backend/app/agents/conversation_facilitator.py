@@ -5,18 +5,22 @@ Ensures safe, supportive interactions and appropriate escalation.
 """
 
 from typing import Dict, List
-from anthropic import Anthropic
-import os
 import sys
 sys.path.append('/home/claude')
+from app.agents.llm_gateway import get_gateway
+from app.agents.structured_output import extract_json
+from app.models.schemas import FacilitationResponse
 from app.agents.bu_resources import get_crisis_resources, get_mental_health_resources, get_quiet_spaces
+from app.logging_config import get_logger
+
+logger = get_logger("agents.ConversationFacilitator")
 
 class ConversationFacilitator:
     def __init__(self):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        self.llm = get_gateway()
         self.conversation_history = []
         
-    def facilitate_conversation(
+    async def facilitate_conversation(
         self, 
         message: str, 
         conversation_context: Dict
@@ -85,21 +89,14 @@ Conversation History (last 5 messages):
 Analyze this conversation and provide facilitation guidance.
 """
             
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
+            facilitation = (await self.llm.complete_structured(
+                context_str,
+                FacilitationResponse,
                 system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": context_str
-                    }
-                ]
-            )
-            
-            # Parse response
-            import json
-            facilitation = json.loads(response.content[0].text)
+                max_tokens=1000,
+                agent="ConversationFacilitator",
+                priority=True  # safety monitoring
+            )).model_dump()
             
             # Add message to history
             self.conversation_history.append({
@@ -109,8 +106,8 @@ Analyze this conversation and provide facilitation guidance.
             
             return facilitation
             
-        except Exception as e:
-            print(f"Error in conversation facilitation: {e}")
+        except Exception:
+            logger.exception("Error in conversation facilitation")
             return {
                 "intervention_needed": False,
                 "intervention_type": None,
@@ -148,7 +145,7 @@ Analyze this conversation and provide facilitation guidance.
         recent = self.conversation_history[-5:] if len(self.conversation_history) > 5 else self.conversation_history
         return "\n".join([item["message"] for item in recent])
     
-    def suggest_conversation_starters(self, match_context: Dict) -> List[str]:
+    async def suggest_conversation_starters(self, match_context: Dict) -> List[str]:
         """Generate conversation starters based on match context"""
         
         system_prompt = """Generate 3-4 warm, natural conversation starters for BU students who just matched for peer support.
@@ -167,24 +164,18 @@ Examples:
 Return as JSON array: ["starter1", "starter2", "starter3"]"""
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=500,
+            response_text = await self.llm.complete(
+                f"Match context: {match_context}",
                 system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"Match context: {match_context}"
-                    }
-                ]
+                max_tokens=500,
+                agent="ConversationFacilitator"
             )
             
-            import json
-            starters = json.loads(response.content[0].text)
+            starters = extract_json(response_text)
             return starters
             
-        except Exception as e:
-            print(f"Error generating conversation starters: {e}")
+        except Exception:
+            logger.exception("Error generating conversation starters")
             return [
                 "Hey! How's your day going?",
                 "Hi there! Thanks for connecting.",
@@ -5,14 +5,30 @@ Replace your existing email_generator.py with this
 
 from .base_agent import BaseAgent
 from .message_bus import MessageType
+from .llm_gateway import as_gateway
+from app.models.schemas import IntroEmail, IntroEmailPair
+from typing import Optional
 import anthropic
 
 class EmailGenerator(BaseAgent):
-    def __init__(self, message_bus, client: anthropic.Anthropic):
+    # Doesn't process any messages
+    subscriptions = ()
+    
+    # Written where the meeting place goes when the email is drafted before the
+    # location is chosen; fill_location() swaps in the real spot afterwards
+    MEETING_SPOT = "[[MEETING_SPOT]]"
+    
+    def __init__(self, message_bus, client: anthropic.AsyncAnthropic):
         super().__init__("EmailGenerator", message_bus)
         self.client = client
+        self.llm = as_gateway(client)
+    
+    def _location_line(self, location: Optional[dict]) -> str:
+        if location is not None:
+            return str(location)
+        return f"not chosen yet - write {self.MEETING_SPOT} exactly where the meeting place belongs"
     
-    async def generate_email(self, user_profile: dict, match_result: dict, location: dict) -> dict:
+    async def generate_email(self, user_profile: dict, match_result: dict, location: Optional[dict] = None) -> dict:
         """Generate introduction email"""
         
         # Your existing email generation logic
@@ -20,7 +36,7 @@ class EmailGenerator(BaseAgent):
 
 User: {user_profile}
 Match: {match_result}
-Location: {location}
+Location: {self._location_line(location)}
 
 Return JSON with:
 - subject (string)
@@ -28,32 +44,58 @@ Return JSON with:
 - tone (string)"""
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            import json
-            import re
+            result = (await self.llm.complete_structured(
+                prompt, IntroEmail, max_tokens=1000, agent=self.agent_id
+            )).model_dump()
             
-            # Extract JSON from response
-            response_text = response.content[0].text.strip()
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
+            return result
             
-            result = json.loads(response_text)
+        except Exception:
+            self.logger.exception("Error in EmailGenerator")
+            return self.fallback_email()
+    
+    async def generate_intro_emails(self, user_a: dict, user_b: dict, match_result: dict,
+                                    location: Optional[dict] = None) -> tuple:
+        """Generate both students' introduction emails in one model call"""
+        
+        prompt = f"""Create a warm introduction email for each of two matched students.
+
+Student A: {user_a}
+Student B: {user_b}
+Match: {match_result}
+Location: {self._location_line(location)}
+
+Return JSON with:
+- email_a (object with subject, body, tone) - addressed to Student A
+- email_b (object with subject, body, tone) - addressed to Student B"""
+
+        try:
+            result = await self.llm.complete_structured(
+                prompt, IntroEmailPair, max_tokens=2000, agent=self.agent_id
+            )
             
-            return result
+            return result.email_a.model_dump(), result.email_b.model_dump()
             
-        except Exception as e:
-            print(f"Error in EmailGenerator: {e}")
-            return {
-                "subject": "You've been matched!",
-                "body": "We found someone who might be a good peer support match for you.",
-                "tone": "warm"
-            }
+        except Exception:
+            self.logger.exception("Error in EmailGenerator (batched)")
+            return self.fallback_email(), self.fallback_email()
+    
+    @classmethod
+    def fill_location(cls, email: dict, location: dict) -> dict:
+        """Replace the MEETING_SPOT placeholder with the recommended location"""
+        spot = location.get("location") or "a quiet spot on campus"
+        if location.get("address"):
+            spot = f"{spot} ({location['address']})"
+        return {key: value.replace(cls.MEETING_SPOT, spot) if isinstance(value, str) else value
+                for key, value in email.items()}
+    
+    @staticmethod
+    def fallback_email() -> dict:
+        return {
+            "subject": "You've been matched!",
+            "body": "We found someone who might be a good peer support match for you.",
+            "tone": "warm"
+        }
     
     async def process_message(self, message):
         """Email generator doesn't need to process messages"""
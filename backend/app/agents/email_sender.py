@@ -8,6 +8,10 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 
+from app.logging_config import get_logger
+
+logger = get_logger("agents.EmailSender")
+
 class EmailSender:
     def __init__(self):
         self.from_email = os.getenv("GMAIL_ADDRESS")  # Your Gmail
@@ -40,11 +44,11 @@ class EmailSender:
                 server.login(self.from_email, self.app_password)
                 server.send_message(msg)
             
-            print(f"✅ Email sent to {to_email}")
+            logger.info("✅ Email sent to %s", to_email)
             return True
             
-        except Exception as e:
-            print(f"❌ Error sending email: {e}")
+        except Exception:
+            logger.exception("❌ Error sending email")
             return False
         
         
\ No newline at end of file
@@ -0,0 +1,245 @@
+"""
+Local text-embedding index with approximate nearest-neighbour search
+Embeds short texts (a peer's mood post and focus) as hashed TF-IDF vectors
+and finds similar ones with random-hyperplane LSH, all in-process
+
+Embedding: word unigrams and bigrams are hashed (crc32, so stable across
+processes) into `dim` signed buckets; term frequencies are log-scaled and
+weighted by an IDF learned from the indexed texts, then L2-normalised.
+
+Search: each of `tables` hash tables keys a row by the signs of its
+projections onto `bits` random hyperplanes, so rows with a small angle
+between them tend to share a bucket. A query collects the rows in its
+buckets (plus one-bit-flip neighbours when that finds too few) and re-ranks
+them by exact cosine. Small indexes are searched exhaustively.
+
+The IDF is refitted, and all rows re-embedded in one matrix operation, when
+the number of indexed texts has changed by more than a quarter since the
+last fit; between refits, adds and removes are O(tables).
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import re
+import zlib
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i i'm im in is it it's its me my of on or so that the "
+    "this to was with just really still like about been get got than then they their there too very when "
+    "where who will you your all more".split()
+)
+
+
+def tokens(text: str) -> List[str]:
+    """Content words plus adjacent-word bigrams"""
+    words = [w for w in _WORD.findall((text or "").lower()) if len(w) > 2 and w not in _STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class EmbeddingIndex:
+    """Incremental hashed TF-IDF + LSH index keyed by an id string"""
+
+    def __init__(self, dim: int = 256, tables: int = 16, bits: int = 10, exact_below: int = 2000,
+                 capacity: int = 1024, seed: int = 0):
+        self.dim = dim
+        self.tables = tables
+        self.bits = bits
+        self.exact_below = exact_below
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((tables, dim, bits)).astype(np.float32)
+        self._powers = (1 << np.arange(bits)).astype(np.int64)
+
+        self._tf = np.zeros((capacity, dim), dtype=np.float32)
+        self._emb = np.zeros((capacity, dim), dtype=np.float32)
+        self._sigs = np.zeros((capacity, tables), dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(tables)]
+
+        self._df = np.zeros(dim, dtype=np.float32)
+        self._idf = np.ones(dim, dtype=np.float32)
+        self._fitted_size: Optional[int] = 0
+
+        self.refits = 0
+        self.queries = 0
+        self.exact_queries = 0
+        self.candidates_examined = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    # Embedding ---------------------------------------------------------
+
+    def _term_frequencies(self, text: str) -> np.ndarray:
+        row = np.zeros(self.dim, dtype=np.float32)
+        for token in tokens(text):
+            h = zlib.crc32(token.encode("utf-8"))
+            row[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        return np.sign(row) * np.log1p(np.abs(row))
+
+    def _embed(self, tf: np.ndarray) -> np.ndarray:
+        weighted = tf * self._idf
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return np.divide(weighted, norms, out=np.zeros_like(weighted), where=norms > 0)
+
+    def _signatures(self, emb: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (n, tables) bucket keys"""
+        projected = np.einsum("nd,tdb->ntb", emb, self._planes) > 0
+        return projected.astype(np.int64) @ self._powers
+
+    def _maybe_refit(self) -> None:
+        if self._fitted_size is None:  # inside add_many
+            return
+        size = len(self._rows)
+        if size and abs(size - self._fitted_size) > max(1, self._fitted_size) * 0.25:
+            self.refit()
+
+    def refit(self) -> None:
+        """Recompute the IDF from the indexed texts and re-embed every row"""
+        size = len(self._rows)
+        self._idf = (np.log((1 + size) / (1 + self._df)) + 1).astype(np.float32)
+        self._fitted_size = size
+        self.refits += 1
+        rows = np.flatnonzero(self._active)
+        self._emb[rows] = self._embed(self._tf[rows])
+        self._sigs[rows] = self._signatures(self._emb[rows])
+        self._buckets = [{} for _ in range(self.tables)]
+        for t in range(self.tables):
+            buckets = self._buckets[t]
+            for row, key in zip(rows.tolist(), self._sigs[rows, t].tolist()):
+                buckets.setdefault(key, set()).add(row)
+
+    # Updates -----------------------------------------------------------
+
+    def _grow(self) -> None:
+        old = len(self._ids)
+        self._tf = np.vstack([self._tf, np.zeros_like(self._tf)])
+        self._emb = np.vstack([self._emb, np.zeros_like(self._emb)])
+        self._sigs = np.vstack([self._sigs, np.zeros_like(self._sigs)])
+        self._active = np.concatenate([self._active, np.zeros(old, dtype=bool)])
+        self._ids.extend([None] * old)
+        self._free.extend(range(2 * old - 1, old - 1, -1))
+
+    def _bucket(self, row: int) -> None:
+        for t, key in enumerate(self._sigs[row]):
+            self._buckets[t].setdefault(int(key), set()).add(row)
+
+    def _unbucket(self, row: int) -> None:
+        for t, key in enumerate(self._sigs[row]):
+            bucket = self._buckets[t].get(int(key))
+            if bucket is not None:
+                bucket.discard(row)
+                if not bucket:
+                    del self._buckets[t][int(key)]
+
+    def _store(self, key: str, text: str) -> int:
+        """Claim a row for `key` and record its term frequencies"""
+        if key in self._rows:
+            self.remove(key)
+        if not self._free:
+            self._grow()
+        row = self._free.pop()
+        self._rows[key] = row
+        self._ids[row] = key
+        self._active[row] = True
+        self._tf[row] = self._term_frequencies(text)
+        self._df += self._tf[row] != 0
+        return row
+
+    def add(self, key: str, text: str) -> None:
+        """Index `text` under `key`, replacing any previous text for it"""
+        row = self._store(key, text)
+        self._emb[row] = self._embed(self._tf[row])
+        self._sigs[row] = self._signatures(self._emb[row][None, :])[0]
+        self._bucket(row)
+        self._maybe_refit()
+
+    def add_many(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Index several (key, text) pairs; they are embedded together by one refit"""
+        fitted, self._fitted_size = self._fitted_size, None  # no refits from replaced keys
+        try:
+            for key, text in items:
+                self._store(key, text)
+        finally:
+            self._fitted_size = fitted
+        self.refit()
+
+    def remove(self, key: str) -> bool:
+        row = self._rows.pop(key, None)
+        if row is None:
+            return False
+        self._unbucket(row)
+        self._df -= self._tf[row] != 0
+        self._tf[row] = 0
+        self._emb[row] = 0
+        self._active[row] = False
+        self._ids[row] = None
+        self._free.append(row)
+        self._maybe_refit()
+        return True
+
+    # Search ------------------------------------------------------------
+
+    def _candidates(self, query: np.ndarray, want: int) -> np.ndarray:
+        keys = self._signatures(query[None, :])[0]
+        found: Set[int] = set()
+        for t, key in enumerate(keys):
+            found |= self._buckets[t].get(int(key), set())
+        if len(found) < want:
+            # Multi-probe: buckets whose key differs from the query's in one bit
+            for t, key in enumerate(keys):
+                for b in range(self.bits):
+                    found |= self._buckets[t].get(int(key) ^ (1 << b), set())
+        return np.fromiter(found, dtype=np.intp, count=len(found))
+
+    def query(self, text: str, k: int = 10, exclude: Iterable[str] = (),
+              allow: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Up to `k` (key, cosine similarity) pairs most similar to `text`, best first
+
+        Keys in `exclude` are skipped; if `allow` is given, only those keys
+        are returned.
+        """
+        self.queries += 1
+        query = self._embed(self._term_frequencies(text))
+        if not query.any() or not self._rows:
+            return []
+        skip = {self._rows[key] for key in exclude if key in self._rows}
+        want = k + len(skip)
+
+        if len(self._rows) < self.exact_below:
+            self.exact_queries += 1
+            rows = np.flatnonzero(self._active)
+        else:
+            rows = self._candidates(query, want * 4)
+        self.candidates_examined += len(rows)
+
+        if skip:
+            rows = rows[~np.isin(rows, list(skip))]
+        if allow is not None:
+            rows = rows[[self._ids[r] in allow for r in rows]] if len(rows) else rows
+        if not len(rows):
+            return []
+        sims = self._emb[rows] @ query
+        top = np.argpartition(-sims, k)[:k] if len(rows) > k else np.arange(len(rows))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [(self._ids[rows[i]], float(sims[i])) for i in top]
+
+    def get_metrics(self) -> Dict[str, float]:
+        return {
+            "indexed": len(self._rows),
+            "dim": self.dim,
+            "tables": self.tables,
+            "bits": self.bits,
+            "refits": self.refits,
+            "queries": self.queries,
+            "exact_queries": self.exact_queries,
+            "avg_candidates": round(self.candidates_examined / self.queries, 1) if self.queries else 0.0
+        }
@@ -0,0 +1,60 @@
+"""
+Concurrent fan-out with per-branch timeouts and fallbacks
+Lets a route run independent agent calls side by side, so its latency is the
+slowest branch rather than the sum of all of them
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+from dataclasses import dataclass
+import asyncio
+import time
+
+from app.logging_config import get_logger
+
+_log = get_logger("fanout")
+
+
+@dataclass
+class Branch:
+    """One independent call: its coroutine, a time limit and what to use if it fails"""
+    name: str
+    call: Awaitable[Any]
+    timeout: float
+    fallback: Union[Any, Callable[[], Any]] = None
+
+
+@dataclass
+class BranchResult:
+    value: Any
+    seconds: float
+    fell_back: bool = False
+    error: Optional[str] = None
+
+
+async def run_branch(branch: Branch) -> BranchResult:
+    """Await one branch, substituting its fallback on timeout or error"""
+    started = time.perf_counter()
+    try:
+        value = await asyncio.wait_for(branch.call, branch.timeout)
+        return BranchResult(value, time.perf_counter() - started)
+    except asyncio.TimeoutError:
+        error = f"timed out after {branch.timeout:.1f}s"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    _log.warning("⚠️ Branch %s failed (%s); using fallback", branch.name, error)
+    fallback = branch.fallback() if callable(branch.fallback) else branch.fallback
+    return BranchResult(fallback, time.perf_counter() - started, fell_back=True, error=error)
+
+
+async def fan_out(*branches: Branch) -> Dict[str, BranchResult]:
+    """Run branches concurrently; never raises for a single branch's failure"""
+    results = await asyncio.gather(*(run_branch(b) for b in branches))
+    return {branch.name: result for branch, result in zip(branches, results)}
+
+
+def timings(results: Dict[str, BranchResult]) -> Dict[str, Any]:
+    """Per-branch timing summary for API responses and logs"""
+    return {
+        name: {"ms": round(r.seconds * 1000, 1), "fallback": r.fell_back, **({"error": r.error} if r.error else {})}
+        for name, r in results.items()
+    }
@@ -0,0 +1,357 @@
+"""
+Async LLM Gateway
+The single place agents go through to call Claude, so a model call never
+blocks the event loop
+
+Agents `await gateway.complete(prompt)` and get the response text back.
+With an `anthropic.AsyncAnthropic` client the request is awaited natively.
+A synchronous client (e.g. `anthropic.Anthropic` in a script) is still
+accepted, but each call runs on a worker thread so other requests keep
+making progress while it waits.
+
+`get_gateway()` returns the process-wide gateway: one AsyncAnthropic client
+over a shared keep-alive connection pool, with a global cap on in-flight
+calls and optional per-agent caps. A few global slots are reserved for
+priority (crisis-detection) calls, so a burst of /find-match traffic cannot
+starve them.
+
+Identical concurrent calls (same model, system prompt, messages and token
+limit) are coalesced: only the first goes to the model and the others await
+its result. Nothing is kept once the call finishes.
+
+`complete_structured()` returns a validated pydantic model: the schema is
+sent as a forced tool, text replies are scanned for JSON, and an unusable
+reply gets one repair retry (see structured_output.py).
+
+Environment:
+    LLM_MAX_CONNECTIONS      HTTP connections in the pool (default 20)
+    LLM_MAX_KEEPALIVE        Idle keep-alive connections kept open (default 10)
+    LLM_MAX_CONCURRENCY      Global in-flight model calls (default 16)
+    LLM_PRIORITY_RESERVED    Global slots only priority calls may use (default 2)
+    LLM_AGENT_CONCURRENCY    Per-agent caps, e.g. "PeerMatcher=4,EmailGenerator=4"
+"""
+
+from typing import List, Dict, Any, Optional, Type, TypeVar, Union
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import time
+
+from pydantic import BaseModel
+
+from app.logging_config import get_logger
+from . import structured_output
+from .structured_output import StructuredOutputError, parse_stats
+
+_log = get_logger("llm")
+
+DEFAULT_MODEL = "claude-sonnet-4-20250514"
+
+T = TypeVar("T", bound=BaseModel)
+
+_client = None
+_gateway: Optional["LLMGateway"] = None
+
+
+class ConcurrencyLimiter:
+    """
+    Global and per-agent caps on in-flight model calls, with wait metrics
+
+    Normal calls must pass a semaphore of `max_concurrency - reserved`
+    before taking a global slot, so at least `reserved` global slots are
+    always left for priority calls.
+    """
+
+    def __init__(self, max_concurrency: int = 16, reserved: int = 2,
+                 per_agent: Optional[Dict[str, int]] = None):
+        self.max_concurrency = max_concurrency
+        self.reserved = min(reserved, max_concurrency - 1)
+        self.per_agent_limits = dict(per_agent or {})
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.waiting = 0
+        self.waiting_by_agent: Dict[str, int] = {}
+        self.in_flight = 0
+        self.calls = 0
+        self.priority_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _bind(self) -> None:
+        """Semaphores belong to one event loop; (re)create them for the running one"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._normal = asyncio.Semaphore(self.max_concurrency - self.reserved)
+        self._agents = {agent: asyncio.Semaphore(limit) for agent, limit in self.per_agent_limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, agent: Optional[str] = None, priority: bool = False):
+        """Hold a slot for one model call"""
+        self._bind()
+        agent_key = agent or "unknown"
+        agent_sem = self._agents.get(agent) if agent else None
+        held = []
+
+        started = time.perf_counter()
+        self.waiting += 1
+        self.waiting_by_agent[agent_key] = self.waiting_by_agent.get(agent_key, 0) + 1
+        try:
+            if agent_sem is not None:
+                await agent_sem.acquire()
+                held.append(agent_sem)
+            if not priority:
+                await self._normal.acquire()
+                held.append(self._normal)
+            await self._global.acquire()
+            held.append(self._global)
+        except BaseException:
+            for sem in held:
+                sem.release()
+            raise
+        finally:
+            self.waiting -= 1
+            self.waiting_by_agent[agent_key] -= 1
+
+        waited = time.perf_counter() - started
+        self.calls += 1
+        self.priority_calls += priority
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            for sem in reversed(held):
+                sem.release()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self.waiting,
+            "queue_depth_by_agent": {a: n for a, n in self.waiting_by_agent.items() if n},
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "priority_reserved": self.reserved,
+            "calls": self.calls,
+            "priority_calls": self.priority_calls,
+            "avg_wait_ms": round(self.total_wait / self.calls * 1000, 2) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2)
+        }
+
+
+class LLMGateway:
+    """Async facade over an Anthropic client (None is allowed until a call is made)"""
+
+    def __init__(self, client, model: str = DEFAULT_MODEL,
+                 limiter: Optional[ConcurrencyLimiter] = None):
+        self.client = client
+        self.model = model
+        self.limiter = limiter or ConcurrencyLimiter()
+        self._is_async = client is not None and inspect.iscoroutinefunction(client.messages.create)
+        self._flights: Dict[str, asyncio.Task] = {}  # request hash -> in-flight call
+        self.calls = 0
+        self.coalesced_calls = 0
+        self.total_latency = 0.0
+
+    async def complete(self, prompt: Optional[str] = None, *,
+                       messages: Optional[List[Dict[str, Any]]] = None,
+                       system: Optional[str] = None,
+                       max_tokens: int = 1000,
+                       model: Optional[str] = None,
+                       agent: Optional[str] = None,
+                       priority: bool = False) -> str:
+        """
+        Run one model call and return its text
+
+        If an identical request is already in flight, this waits for its
+        result instead of calling the model again.
+
+        Args:
+            prompt: Single user turn (shorthand for messages=[{"role": "user", ...}])
+            messages: Full message list, if more than one turn is needed
+            system: Optional system prompt
+            max_tokens: Response token limit
+            model: Override the gateway's default model
+            agent: Calling agent's id, for per-agent limits and logs
+            priority: Crisis-detection call; may use the reserved slots
+        """
+        request = self._request(prompt, messages, system, max_tokens, model)
+        return _response_text(await self._send(request, agent, priority))
+
+    async def complete_structured(self, prompt: str, schema: Type[T], *,
+                                  system: Optional[str] = None,
+                                  max_tokens: int = 1000,
+                                  model: Optional[str] = None,
+                                  agent: Optional[str] = None,
+                                  priority: bool = False) -> T:
+        """
+        Run one model call and return its reply validated as `schema`
+
+        The schema is offered as a forced tool. If the reply carries text
+        instead, the first JSON value in it is used. When neither validates,
+        the model gets one repair turn with the error before this raises
+        StructuredOutputError.
+        """
+        tool = structured_output.tool_for(schema)
+        request = self._request(prompt, None, system, max_tokens, model)
+        request["tools"] = [tool]
+        request["tool_choice"] = {"type": "tool", "name": tool["name"]}
+        parse_stats.calls += 1
+
+        response = await self._send(request, agent, priority)
+        tool_input = next(
+            (block.input for block in response.content
+             if getattr(block, "type", None) == "tool_use" and block.name == tool["name"]),
+            None
+        )
+        text = _response_text(response)
+        try:
+            if tool_input is not None:
+                result = structured_output.validate(tool_input, schema)
+                parse_stats.tool_use += 1
+            else:
+                result = structured_output.parse(text, schema)
+                parse_stats.text_fallback += 1
+            return result
+        except StructuredOutputError as error:
+            _log.warning("⚠️ Unusable %s reply, asking for a repair: %s", schema.__name__, str(error)[:200],
+                         extra={"fields": {"agent": agent}})
+            first_error = error
+
+        previous = json.dumps(tool_input) if tool_input is not None else (text or "(empty)")
+        repair = self._request(None, [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": previous},
+            {"role": "user", "content": structured_output.repair_prompt(first_error, schema)}
+        ], system, max_tokens, model)
+        try:
+            result = structured_output.parse(_response_text(await self._send(repair, agent, priority)), schema)
+        except StructuredOutputError:
+            parse_stats.failures += 1
+            raise
+        parse_stats.repaired += 1
+        return result
+
+    def _request(self, prompt: Optional[str], messages: Optional[List[Dict[str, Any]]],
+                 system: Optional[str], max_tokens: int, model: Optional[str]) -> Dict[str, Any]:
+        request = {
+            "model": model or self.model,
+            "max_tokens": max_tokens,
+            "messages": messages if messages is not None else [{"role": "user", "content": prompt}]
+        }
+        if system is not None:
+            request["system"] = system
+        return request
+
+    async def _send(self, request: Dict[str, Any], agent: Optional[str], priority: bool):
+        """Send a request, joining an identical one that is already in flight"""
+        key = hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._call(request, agent, priority))
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._land(key, done))
+        else:
+            self.coalesced_calls += 1
+            _log.debug("🔗 Joined in-flight LLM call", extra={"fields": {"agent": agent}})
+        # Shielded so one caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(flight)
+
+    def _land(self, key: str, flight: asyncio.Task) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.cancelled():
+            flight.exception()  # retrieved here in case every caller already gave up
+
+    async def _call(self, request: Dict[str, Any], agent: Optional[str], priority: bool):
+        if self.client is None:
+            raise RuntimeError("LLMGateway has no Anthropic client configured")
+        async with self.limiter.slot(agent, priority):
+            started = time.perf_counter()
+            if self._is_async:
+                response = await self.client.messages.create(**request)
+            else:
+                response = await asyncio.to_thread(self.client.messages.create, **request)
+            elapsed = time.perf_counter() - started
+
+        self.calls += 1
+        self.total_latency += elapsed
+        _log.debug("🤖 LLM call done", extra={"fields": {"agent": agent, "model": request["model"], "seconds": round(elapsed, 3)}})
+        return response
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            **self.limiter.get_metrics(),
+            "coalesced_calls": self.coalesced_calls,
+            "avg_latency_ms": round(self.total_latency / self.calls * 1000, 2) if self.calls else 0.0,
+            "structured_output": parse_stats.get_metrics()
+        }
+
+
+def _response_text(response) -> str:
+    return "".join(block.text for block in response.content if getattr(block, "type", "text") == "text").strip()
+
+
+def as_gateway(client: Union["LLMGateway", Any]) -> LLMGateway:
+    """Agents accept either a gateway or a raw Anthropic client"""
+    return client if isinstance(client, LLMGateway) else LLMGateway(client)
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for part in spec.split(","):
+        if "=" in part:
+            agent, limit = part.split("=", 1)
+            limits[agent.strip()] = int(limit)
+    return limits
+
+
+def get_client():
+    """The process-wide AsyncAnthropic client, on a tuned keep-alive connection pool"""
+    global _client
+    if _client is None:
+        import anthropic
+        # The SDK only accepts its own client class, and its Limits/Timeout must come from the
+        # HTTP package it is built on (httpx, or the httpx2 fork in newer SDK builds)
+        http = importlib.import_module(anthropic.DefaultAsyncHttpxClient.__mro__[1].__module__.partition(".")[0])
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            limits=http.Limits(
+                max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+                keepalive_expiry=30.0
+            ),
+            timeout=http.Timeout(60.0, connect=5.0)
+        )
+        _client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), http_client=http_client)
+    return _client
+
+
+def get_gateway() -> LLMGateway:
+    """The process-wide gateway every route and agent shares"""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(
+            get_client(),
+            limiter=ConcurrencyLimiter(
+                max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "16")),
+                reserved=int(os.getenv("LLM_PRIORITY_RESERVED", "2")),
+                per_agent=_parse_limits(os.getenv("LLM_AGENT_CONCURRENCY", ""))
+            )
+        )
+    return _gateway
+
+
+async def close_gateway() -> None:
+    """Close the shared client's connection pool (app shutdown)"""
+    global _client, _gateway
+    if _client is not None:
+        await _client.close()
+    _client = None
+    _gateway = None
@@ -4,13 +4,19 @@ Replace your existing location_agent.py with this
 """
 
 from .base_agent import BaseAgent
-from .message_bus import MessageType
+from .message_bus import MessageType, Subscription
+from .llm_gateway import as_gateway
+from app.models.schemas import LocationRecommendation
 import anthropic
 
 class LocationAgent(BaseAgent):
-    def __init__(self, message_bus, client: anthropic.Anthropic):
+    # Only answers environment queries; decision NOTIFICATIONs are not for it
+    subscriptions = (Subscription(message_types=frozenset({MessageType.QUERY})),)
+    
+    def __init__(self, message_bus, client: anthropic.AsyncAnthropic):
         super().__init__("LocationAgent", message_bus)
         self.client = client
+        self.llm = as_gateway(client)
     
     async def recommend_location(self, mood_themes: list, student_a: dict, student_b: dict) -> dict:
         """Recommend meeting location"""
@@ -29,22 +35,9 @@ Return JSON with:
 - alternative_locations (list)"""
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            import json
-            import re
-            
-            # Extract JSON from response
-            response_text = response.content[0].text.strip()
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
-            
-            result = json.loads(response_text)
+            result = (await self.llm.complete_structured(
+                prompt, LocationRecommendation, max_tokens=1000, agent=self.agent_id
+            )).model_dump()
             
             # Log decision
             self.log_decision(
@@ -55,8 +48,8 @@ Return JSON with:
             
             return result
             
-        except Exception as e:
-            print(f"Error in LocationAgent: {e}")
+        except Exception:
+            self.logger.exception("Error in LocationAgent")
             return {
                 "location": "Mugar Library - 5th Floor",
                 "reasoning": "Quiet study space",
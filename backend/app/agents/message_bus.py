@@ -3,11 +3,58 @@ Message Bus System for Multi-Agent Communication
 Enables agents to send/receive messages asynchronously
 """
 
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Union, FrozenSet, Iterable, TYPE_CHECKING
+from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass, field
+from bisect import bisect_right, insort
+from collections import deque, Counter, OrderedDict
+from heapq import merge
+from itertools import islice, count
+import asyncio
 import json
+import os
+import uuid
+import weakref
+
+from app.logging_config import get_logger
+
+if TYPE_CHECKING:
+    from .base_agent import BaseAgent
+    from .message_log import MessageLog
+    from .transport import InMemoryTransport
+
+_log = get_logger("bus")
+
+
+DEFAULT_REQUEST_TIMEOUT = 5.0  # seconds a request() waits for its reply
+MAX_TRACKED_SESSIONS = 1000    # per-session counters kept for the most recent sessions
+
+# Message ids are "<node prefix>_<sequence>": the prefix is unique per process
+# (so ids never collide across restarts or workers sharing a log) and the
+# sequence is a process-wide counter, so two messages created in the same
+# microsecond - or by concurrent asyncio tasks - still get distinct ids.
+# MESSAGE_NODE_ID only names the prefix: every uvicorn worker inherits the
+# same environment, so the random part is always added.
+NODE_ID = "-".join(filter(None, (os.getenv("MESSAGE_NODE_ID"), uuid.uuid4().hex[:8])))
+_message_sequence = count(1)
+
+_env_buses: "weakref.WeakSet[MessageBus]" = weakref.WeakSet()  # root buses built by from_env()
+
+
+def next_message_id() -> str:
+    """Monotonic, collision-free message id"""
+    return f"msg_{NODE_ID}_{next(_message_sequence):010d}"
+
+
+# Structured tags recorded on messages at send time (instead of searching content later)
+TAG_REQUESTING_APPROVAL = "requesting_approval"
+TAG_SAFETY_OBJECTION = "SAFETY_OBJECTION"
+TAG_CRISIS = "CRISIS_DETECTED"
+
+
+class RequestTimeout(TimeoutError):
+    """Raised when a request() gets no reply before its deadline"""
 
 
 class MessageType(Enum):
@@ -21,65 +68,644 @@ class MessageType(Enum):
     FEEDBACK = "feedback"             # Comment on another agent's output
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentMessage:
-    """Standard message format for inter-agent communication"""
+    """
+    Standard message format for inter-agent communication
+    
+    Slotted to keep per-message memory small. Messages are treated as
+    immutable once sent, so to_dict() is computed once and cached.
+    """
     sender: str                       # Agent who sent the message
     receiver: str                     # Target agent or "ALL" for broadcast
     message_type: MessageType
     content: Dict[str, Any]           # Message payload
     timestamp: datetime = field(default_factory=datetime.now)
-    message_id: str = field(default_factory=lambda: f"msg_{datetime.now().timestamp()}")
+    message_id: str = field(default_factory=next_message_id)
     in_reply_to: Optional[str] = None  # For threading conversations
+    session_id: Optional[str] = None   # Coordination run the message belongs to
+    tags: FrozenSet[str] = frozenset()  # Structured flags, e.g. TAG_SAFETY_OBJECTION
+    _serialized: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
     
     def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for JSON serialization"""
-        return {
-            "message_id": self.message_id,
-            "sender": self.sender,
-            "receiver": self.receiver,
-            "message_type": self.message_type.value,
-            "content": self.content,
-            "timestamp": self.timestamp.isoformat(),
-            "in_reply_to": self.in_reply_to
-        }
+        """Convert to dictionary for JSON serialization (cached after the first call)"""
+        if self._serialized is None:
+            self._serialized = {
+                "message_id": self.message_id,
+                "sender": self.sender,
+                "receiver": self.receiver,
+                "message_type": self.message_type.value,
+                "content": self.content,
+                "timestamp": self.timestamp.isoformat(),
+                "in_reply_to": self.in_reply_to,
+                "session_id": self.session_id,
+                "tags": sorted(self.tags)
+            }
+        return self._serialized
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgentMessage":
+        """Rebuild a message from to_dict() output"""
+        return cls(
+            sender=data["sender"],
+            receiver=data["receiver"],
+            message_type=MessageType(data["message_type"]),
+            content=data.get("content", {}),
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            message_id=data["message_id"],
+            in_reply_to=data.get("in_reply_to"),
+            session_id=data.get("session_id"),
+            tags=frozenset(data.get("tags", ()))
+        )
     
     def __repr__(self):
         return f"[{self.sender} → {self.receiver}] {self.message_type.value}: {self.content.get('summary', '')}"
 
 
-class MessageBus:
-    """Central communication hub for all agents"""
+@dataclass(frozen=True)
+class Subscription:
+    """
+    Which messages an agent wants delivered
+    
+    Each field is a filter; None means "any". A message matches when it
+    passes every filter. `topics` matches against the message's tags.
+    Agents declare a tuple of these and receive a message if any matches;
+    an empty tuple means the agent receives nothing.
+    """
+    message_types: Optional[FrozenSet[MessageType]] = None
+    senders: Optional[FrozenSet[str]] = None
+    topics: Optional[FrozenSet[str]] = None
+    
+    def matches(self, message: AgentMessage) -> bool:
+        return (
+            (self.message_types is None or message.message_type in self.message_types)
+            and (self.senders is None or message.sender in self.senders)
+            and (self.topics is None or not self.topics.isdisjoint(message.tags))
+        )
+
+
+ALL_MESSAGES = (Subscription(),)
+
+
+def _timestamp(message: AgentMessage) -> datetime:
+    return message.timestamp
+
+
+class _MessageIndex:
+    """
+    Time-ordered ring of messages with O(log n) lookup by timestamp
+    
+    Eviction only ever removes the oldest entry, so popleft() just advances a
+    head offset and the backing list is compacted once half of it is dead.
+    Local messages arrive in timestamp order and are appended; a late one
+    (e.g. delayed from another worker) is inserted at its timestamp.
+    """
+    
+    _COMPACT_AFTER = 1024
     
     def __init__(self):
-        self.messages: List[AgentMessage] = []
-        self.subscribers: Dict[str, List[str]] = {}  # agent_id -> [message_types]
+        self.items: List[Optional[AgentMessage]] = []
+        self.head = 0
+    
+    def append(self, message: AgentMessage) -> int:
+        """Add a message in timestamp order; returns its position (0 = oldest)"""
+        items = self.items
+        if len(items) == self.head or items[-1].timestamp <= message.timestamp:
+            items.append(message)
+            return len(items) - 1 - self.head
+        position = bisect_right(items, message.timestamp, lo=self.head, key=_timestamp)
+        items.insert(position, message)
+        return position - self.head
+    
+    def popleft(self) -> AgentMessage:
+        message = self.items[self.head]
+        self.items[self.head] = None  # release the reference straight away
+        self.head += 1
+        if self.head >= self._COMPACT_AFTER and self.head * 2 >= len(self.items):
+            del self.items[:self.head]
+            self.head = 0
+        return message
+    
+    def first(self) -> Optional[AgentMessage]:
+        return self.items[self.head] if self.head < len(self.items) else None
+    
+    def since(self, since: Optional[datetime] = None) -> List[AgentMessage]:
+        """Messages strictly newer than `since` (all messages if None)"""
+        if since is None:
+            return self.items[self.head:]
+        start = bisect_right(self.items, since, lo=self.head, key=_timestamp)
+        return self.items[start:]
+    
+    def __len__(self) -> int:
+        return len(self.items) - self.head
+    
+    def __iter__(self) -> Iterator[AgentMessage]:
+        return islice(self.items, self.head, None)
+    
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.items[self.head + start:self.head + stop:step]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("message index out of range")
+        return self.items[self.head + key]
+
+
+def close_env_buses() -> None:
+    """Close every bus built by MessageBus.from_env (app shutdown): drains their logs and spill files"""
+    for bus in list(_env_buses):
+        bus.close()
+    _env_buses.clear()
+
+
+class MessageBus:
+    """
+    Central communication hub for all agents
+    
+    Messages are always recorded in the history. Once `start_delivery()` has
+    been awaited, the bus also pushes every message onto the inbox queue of
+    each registered recipient, where the agent's dispatcher task processes it
+    immediately. Senders can `await deliver(message)` or `await drain()`
+    instead of sleeping and polling.
+    """
+    
+    def __init__(self, max_messages: Optional[int] = None,
+                 max_age: Optional[timedelta] = None,
+                 max_bytes: Optional[int] = None,
+                 spill_path: Optional[str] = None,
+                 parent: Optional["MessageBus"] = None,
+                 session_id: Optional[str] = None,
+                 log: Optional["MessageLog"] = None,
+                 transport: Optional["InMemoryTransport"] = None):
+        """
+        Args:
+            max_messages: Keep at most this many messages in memory
+            max_age: Evict messages older than this
+            max_bytes: Keep the serialized size of retained messages under this
+            spill_path: Append evicted messages to this JSON-lines file
+            parent: Bus that also records everything sent here (see session())
+            session_id: Stamped on every message sent through this bus
+            log: Durable MessageLog that every recorded message is appended to
+            transport: Shares messages with other worker processes (root bus only)
+        """
+        self.parent = parent
+        self.session_id = session_id
+        self.log = log
+        self.transport = transport
+        self._sessions: "weakref.WeakValueDictionary[str, MessageBus]" = weakref.WeakValueDictionary()
+        self.messages = _MessageIndex()
+        self.subscribers: Dict[str, Tuple[Subscription, ...]] = {}  # agent_id -> subscriptions
+        self.agents: Dict[str, "BaseAgent"] = {}     # agent_id -> agent, for push delivery
+        self.delivered_count = 0                     # messages pushed to agent inboxes
+        self._reset_indexes()
+        self._reset_counters()
+        
+        # Retention
+        self.max_messages = max_messages
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self._sizes: deque = deque()  # serialized size of each retained message (max_bytes only)
+        self._retained_bytes = 0
+        self._spill_file = None
+        self.evicted_count = 0
+        
+        # Async delivery state (bound to the loop that called start_delivery)
+        self._delivery_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._deliveries: Dict[str, List[Any]] = {}  # message_id -> [pending recipients, future]
+        self._in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._reply_waiters: Dict[str, asyncio.Future] = {}  # request message_id -> future reply
+    
+    def _reset_indexes(self) -> None:
+        """(Re)create the lookup indexes used by get_messages_for"""
+        self._inbox: Dict[str, _MessageIndex] = {}                          # receiver -> direct messages
+        self._inbox_by_type: Dict[Tuple[str, MessageType], _MessageIndex] = {}  # (receiver, type) -> direct messages
+        self._broadcasts = _MessageIndex()                                  # receiver == "ALL"
+        self._broadcasts_by_type: Dict[MessageType, _MessageIndex] = {}     # type -> broadcasts
+        self._thread_root: Dict[str, str] = {}                              # message_id -> root message_id
+        self._threads: Dict[str, deque] = {}                                # root message_id -> thread, oldest first
+    
+    def _reset_counters(self) -> None:
+        """Live counters over every message ever recorded (not only retained ones)"""
+        self.total_sent = 0
+        self._by_sender: Counter = Counter()
+        self._by_type: Counter = Counter()
+        self._by_pair: Counter = Counter()                    # (sender, receiver) -> count
+        self._by_tag: Counter = Counter()
+        self._by_session: "OrderedDict[str, int]" = OrderedDict()  # most recent sessions last
+    
+    def _count(self, message: AgentMessage) -> None:
+        """O(1) counter update for one recorded message"""
+        self.total_sent += 1
+        self._by_sender[message.sender] += 1
+        self._by_type[message.message_type.value] += 1
+        self._by_pair[(message.sender, message.receiver)] += 1
+        for tag in message.tags:
+            self._by_tag[tag] += 1
+        if message.session_id is not None:
+            sessions = self._by_session
+            sessions[message.session_id] = sessions.get(message.session_id, 0) + 1
+            sessions.move_to_end(message.session_id)
+            if len(sessions) > MAX_TRACKED_SESSIONS:
+                sessions.popitem(last=False)
+    
+    def count_by_type(self, message_type: MessageType) -> int:
+        return self._by_type.get(message_type.value, 0)
+    
+    def count_by_tag(self, tag: str) -> int:
+        return self._by_tag.get(tag, 0)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of the live counters
+        
+        Cost depends on the number of distinct senders/types/pairs, not on
+        the number of messages, so dashboards can poll it freely.
+        """
+        return {
+            "total_messages": self.total_sent,
+            "retained_messages": len(self.messages),
+            "evicted_messages": self.evicted_count,
+            "delivered_messages": self.delivered_count,
+            "by_sender": dict(self._by_sender),
+            "by_type": dict(self._by_type),
+            "by_pair": [
+                {"from": sender, "to": receiver, "count": count}
+                for (sender, receiver), count in self._by_pair.items()
+            ],
+            "by_tag": dict(self._by_tag),
+            "by_session": dict(self._by_session),
+        }
+    
+    @classmethod
+    def from_env(cls, channel: str = "default") -> "MessageBus":
+        """
+        Build a bus configured by env vars: MESSAGE_BUS_* for retention and
+        transport, MESSAGE_LOG_DIR for the durable message log
+        
+        Buses with the same `channel` in different worker processes share
+        their messages when MESSAGE_BUS_TRANSPORT=unix.
+        """
+        from .transport import transport_from_env
+        max_age = os.getenv("MESSAGE_BUS_MAX_AGE_SECONDS")
+        max_bytes = os.getenv("MESSAGE_BUS_MAX_BYTES")
+        log_dir = os.getenv("MESSAGE_LOG_DIR")
+        log = None
+        if log_dir:
+            from .message_log import MessageLog
+            log = MessageLog.shared(log_dir)  # one writer per directory per process
+        bus = cls(
+            max_messages=int(os.getenv("MESSAGE_BUS_MAX_MESSAGES", "10000")),
+            max_age=timedelta(seconds=float(max_age)) if max_age else None,
+            max_bytes=int(max_bytes) if max_bytes else None,
+            spill_path=os.getenv("MESSAGE_BUS_SPILL_PATH") or None,
+            log=log,
+            transport=transport_from_env(channel)
+        )
+        _env_buses.add(bus)
+        return bus
+    
+    def session(self, session_id: Optional[str] = None) -> "MessageBus":
+        """
+        Create a child bus for one coordination run
+        
+        Agents bound to the child only see (and are only delivered) that
+        session's messages, so lookups and response payloads scale with one
+        session. Everything sent on the child is still recorded here for
+        auditing, but is not delivered to this bus's agents.
+        """
+        child = MessageBus(parent=self, session_id=session_id or f"session_{uuid.uuid4().hex}")
+        self._sessions[child.session_id] = child
+        return child
+    
+    def _root(self) -> "MessageBus":
+        bus = self
+        while bus.parent is not None:
+            bus = bus.parent
+        return bus
+    
+    def _index(self, message: AgentMessage) -> None:
+        """Add a message to the receiver/type/broadcast indexes"""
+        if message.receiver == "ALL":
+            self._broadcasts.append(message)
+            self._broadcasts_by_type.setdefault(message.message_type, _MessageIndex()).append(message)
+        else:
+            self._inbox.setdefault(message.receiver, _MessageIndex()).append(message)
+            key = (message.receiver, message.message_type)
+            self._inbox_by_type.setdefault(key, _MessageIndex()).append(message)
+        
+        # Replies join their parent's thread; if the parent was evicted it becomes the root
+        if message.in_reply_to is None:
+            root = message.message_id
+        else:
+            root = self._thread_root.get(message.in_reply_to, message.in_reply_to)
+        self._thread_root[message.message_id] = root
+        thread = self._threads.setdefault(root, deque())
+        if thread and thread[-1].timestamp > message.timestamp:
+            insort(thread, message, key=_timestamp)  # late remote message
+        else:
+            thread.append(message)
+    
+    def _unindex_oldest(self, message: AgentMessage) -> None:
+        """
+        Drop the oldest message from the indexes (it is at the head of each
+        one: every index holds a subsequence of self.messages in the same order)
+        """
+        root = self._thread_root.pop(message.message_id, None)
+        if root is not None:
+            thread = self._threads[root]
+            thread.popleft()
+            if not thread:
+                del self._threads[root]
+        if message.receiver == "ALL":
+            self._broadcasts.popleft()
+            by_type = self._broadcasts_by_type[message.message_type]
+            by_type.popleft()
+            if not by_type:
+                del self._broadcasts_by_type[message.message_type]
+        else:
+            inbox = self._inbox[message.receiver]
+            inbox.popleft()
+            if not inbox:
+                del self._inbox[message.receiver]
+            key = (message.receiver, message.message_type)
+            by_type = self._inbox_by_type[key]
+            by_type.popleft()
+            if not by_type:
+                del self._inbox_by_type[key]
+    
+    def _over_limit(self) -> bool:
+        if self.max_messages is not None and len(self.messages) > self.max_messages:
+            return True
+        if self.max_bytes is not None and self._retained_bytes > self.max_bytes:
+            return True
+        if self.max_age is not None:
+            oldest = self.messages.first()
+            return oldest is not None and oldest.timestamp < datetime.now() - self.max_age
+        return False
+    
+    def _enforce_retention(self) -> None:
+        """Evict the oldest messages until the bus is within its limits"""
+        while self.messages and self._over_limit():
+            message = self.messages.popleft()
+            self._unindex_oldest(message)
+            if self.max_bytes is not None:
+                self._retained_bytes -= self._sizes.popleft()
+            self.evicted_count += 1
+            if self.spill_path:
+                self._spill(message)
+    
+    def _spill(self, message: AgentMessage) -> None:
+        """Append an evicted message to the on-disk segment"""
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, "a", encoding="utf-8")
+        self._spill_file.write(json.dumps(message.to_dict(), separators=(",", ":"), default=str))
+        self._spill_file.write("\n")
+    
+    def close(self) -> None:
+        """Flush and close the spill segment and durable log, if open"""
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        
+    def _record(self, message: AgentMessage, persist: bool = True) -> None:
+        """
+        Store and index a message, then pass it up to the parent bus
+        
+        `persist=False` skips the durable log (for messages received from
+        another worker, which that worker has already logged).
+        """
+        position = self.messages.append(message)
+        self._index(message)
+        self._count(message)
+        if self.max_bytes is not None:
+            size = len(json.dumps(message.to_dict(), separators=(",", ":"), default=str))
+            self._sizes.insert(position, size)  # parallel to self.messages
+            self._retained_bytes += size
+        self._enforce_retention()
+        if self.log is not None and persist:
+            self.log.append(message)
+        if self.parent is not None:
+            self.parent._record(message, persist)
         
     def send(self, message: AgentMessage) -> None:
-        """Post a message to the bus"""
-        self.messages.append(message)
-        print(f"📨 {message}")
+        """Post a message to the bus (and to other workers, if a transport is set)"""
+        if message.session_id is None:
+            message.session_id = self.session_id
+        self._accept(message)
+        _log.debug("📨 %r", message)
+        transport = self._root().transport
+        if transport is not None:
+            transport.publish(message)
+    
+    def receive_remote(self, message: AgentMessage) -> None:
+        """
+        Accept a message published by another worker (called on the root bus
+        by its transport). It goes to the live session bus with the same
+        session_id when there is one, otherwise it is only recorded here.
         
-    def broadcast(self, sender: str, message_type: MessageType, content: Dict[str, Any]) -> AgentMessage:
+        Session ids are only shared when workers open sessions under an
+        agreed id (`session("matching-room")`). The coordinator's per-request
+        sessions get a random id that exists in one worker only, so remote
+        traffic for them is just recorded on the root. A message delayed in
+        transit is indexed at its timestamp, not at its arrival.
+        """
+        target = self._sessions.get(message.session_id) if message.session_id else None
+        (target or self)._accept(message, persist=False)
+        _log.debug("📥 %r", message)
+    
+    def _accept(self, message: AgentMessage, persist: bool = True) -> None:
+        """Record a message, resolve a pending request() and push it to recipients"""
+        self._record(message, persist)
+        if message.in_reply_to is not None:
+            waiter = self._reply_waiters.get(message.in_reply_to)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(message)
+        if self._delivery_active():
+            self._dispatch(message)
+    
+    # ------------------------------------------------------------------
+    # Async push delivery
+    # ------------------------------------------------------------------
+    
+    def register(self, agent: "BaseAgent") -> None:
+        """Register an agent so it can receive pushed messages"""
+        self.agents[agent.agent_id] = agent
+        self.subscribers[agent.agent_id] = tuple(agent.subscriptions)
+        if self._delivery_active():
+            agent.start_dispatcher()
+    
+    def _delivery_active(self) -> bool:
+        """True when called from the loop that owns the dispatcher tasks"""
+        if self._delivery_loop is None:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._delivery_loop
+        except RuntimeError:
+            return False
+    
+    def _recipients(self, message: AgentMessage) -> List["BaseAgent"]:
+        """Registered agents whose subscriptions accept a message"""
+        if message.receiver == "ALL":
+            return [
+                a for agent_id, a in self.agents.items()
+                if agent_id != message.sender and self.is_subscribed(agent_id, message)
+            ]
+        agent = self.agents.get(message.receiver)
+        return [agent] if agent and self.is_subscribed(agent.agent_id, message) else []
+    
+    def is_subscribed(self, agent_id: str, message: AgentMessage) -> bool:
+        """True if any of the agent's subscriptions matches the message"""
+        return any(sub.matches(message) for sub in self.subscribers.get(agent_id, ALL_MESSAGES))
+    
+    def _dispatch(self, message: AgentMessage) -> None:
+        """Push a message onto each recipient's inbox queue"""
+        recipients = self._recipients(message)
+        if not recipients:
+            return
+        self._deliveries[message.message_id] = [len(recipients), self._delivery_loop.create_future()]
+        self._in_flight += len(recipients)
+        self.delivered_count += len(recipients)
+        self._idle.clear()
+        for agent in recipients:
+            agent.inbox.put_nowait(message)
+    
+    def _mark_delivered(self, message: AgentMessage) -> None:
+        """Called by an agent's dispatcher once it has processed a message"""
+        entry = self._deliveries.get(message.message_id)
+        if entry is not None:
+            entry[0] -= 1
+            if entry[0] == 0:
+                del self._deliveries[message.message_id]
+                if not entry[1].done():
+                    entry[1].set_result(None)
+        self._in_flight = max(0, self._in_flight - 1)  # stop_delivery() may have reset it already
+        if self._in_flight == 0:
+            self._idle.set()
+    
+    async def start_delivery(self) -> None:
+        """
+        Start a dispatcher task for every registered agent on the running loop.
+        
+        Idempotent per loop. Messages that were posted before delivery started
+        are handed to the dispatchers as a backlog.
+        """
+        loop = asyncio.get_running_loop()
+        root = self._root()
+        if root.transport is not None:
+            await root.transport.start(root)
+        if self._delivery_loop is loop:
+            return
+        self._delivery_loop = loop
+        self._deliveries = {}
+        self._in_flight = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        
+        for agent in self.agents.values():
+            agent.start_dispatcher()
+            backlog = [
+                m for m in agent.get_messages()
+                if m.sender != agent.agent_id and self.is_subscribed(agent.agent_id, m)
+            ]
+            for message in backlog:
+                self._in_flight += 1
+                self.delivered_count += 1
+                self._idle.clear()
+                agent.inbox.put_nowait(message)
+    
+    def stop_delivery(self) -> None:
+        """Cancel the dispatcher tasks (call when a session bus is finished)"""
+        for agent in self.agents.values():
+            agent.stop_dispatcher()
+        self._delivery_loop = None
+        for waiter in self._deliveries.values():
+            waiter[1].cancel()
+        self._deliveries = {}
+        self._in_flight = 0
+    
+    async def deliver(self, message: AgentMessage) -> None:
+        """Wait until every recipient has processed `message`"""
+        await self.start_delivery()
+        entry = self._deliveries.get(message.message_id)
+        if entry is not None:
+            await asyncio.shield(entry[1])
+    
+    async def request(self, sender: str, receiver: str, content: Dict[str, Any],
+                      message_type: MessageType = MessageType.QUERY,
+                      timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                      tags: Iterable[str] = ()) -> AgentMessage:
+        """
+        Send a message and wait for the first message whose in_reply_to
+        points at it. Raises RequestTimeout if nothing arrives within
+        `timeout` seconds, or straight away if no agent is registered
+        under `receiver`.
+        """
+        await self.start_delivery()
+        if receiver not in self.agents:
+            raise RequestTimeout(f"No agent registered as {receiver} to answer {sender}")
+        
+        message = AgentMessage(
+            sender=sender,
+            receiver=receiver,
+            message_type=message_type,
+            content=content,
+            tags=frozenset(tags)
+        )
+        reply = self._delivery_loop.create_future()
+        self._reply_waiters[message.message_id] = reply
+        try:
+            self.send(message)
+            return await asyncio.wait_for(reply, timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeout(
+                f"{receiver} did not reply to {message.message_id} within {timeout}s"
+            ) from None
+        finally:
+            self._reply_waiters.pop(message.message_id, None)
+    
+    async def drain(self) -> None:
+        """
+        Wait until every inbox is empty, including messages sent while
+        processing other messages. Must not be awaited from inside
+        process_message, since the calling dispatcher would wait on itself.
+        """
+        await self.start_delivery()
+        await self._idle.wait()
+        
+    def broadcast(self, sender: str, message_type: MessageType, content: Dict[str, Any],
+                  tags: Iterable[str] = ()) -> AgentMessage:
         """Send a message to all agents"""
         message = AgentMessage(
             sender=sender,
             receiver="ALL",
             message_type=message_type,
-            content=content
+            content=content,
+            tags=frozenset(tags)
         )
         self.send(message)
         return message
     
     def send_to(self, sender: str, receiver: str, message_type: MessageType, 
-                content: Dict[str, Any], in_reply_to: Optional[str] = None) -> AgentMessage:
+                content: Dict[str, Any], in_reply_to: Optional[str] = None,
+                tags: Iterable[str] = ()) -> AgentMessage:
         """Send a direct message to a specific agent"""
         message = AgentMessage(
             sender=sender,
             receiver=receiver,
             message_type=message_type,
             content=content,
-            in_reply_to=in_reply_to
+            in_reply_to=in_reply_to,
+            tags=frozenset(tags)
         )
         self.send(message)
         return message
@@ -88,37 +714,62 @@ class MessageBus:
                          message_type: Optional[MessageType] = None,
                          unread_only: bool = False,
                          since: Optional[datetime] = None) -> List[AgentMessage]:
-        """Retrieve messages for a specific agent"""
-        messages = [
-            m for m in self.messages
-            if (m.receiver == agent_id or m.receiver == "ALL")
-            and (message_type is None or m.message_type == message_type)
-            and (since is None or m.timestamp > since)
-        ]
-        return messages
+        """
+        Retrieve messages for a specific agent
+        
+        Served from the per-receiver and broadcast indexes, so the cost is
+        proportional to the number of matching messages newer than `since`
+        rather than to the size of the whole history.
+        """
+        if message_type is None:
+            direct = self._inbox.get(agent_id)
+            broadcasts = self._broadcasts
+        else:
+            direct = self._inbox_by_type.get((agent_id, message_type))
+            broadcasts = self._broadcasts_by_type.get(message_type)
+        
+        direct_msgs = direct.since(since) if direct else []
+        broadcast_msgs = broadcasts.since(since) if broadcasts else []
+        if not direct_msgs:
+            return broadcast_msgs
+        if not broadcast_msgs:
+            return direct_msgs
+        # Both indexes are in send order; merge keeps the combined result ordered
+        return list(merge(direct_msgs, broadcast_msgs, key=lambda m: m.timestamp))
     
     def get_conversation_thread(self, message_id: str) -> List[AgentMessage]:
-        """Get all messages in a conversation thread"""
-        thread = []
-        for msg in self.messages:
-            if msg.message_id == message_id or msg.in_reply_to == message_id:
-                thread.append(msg)
-        return sorted(thread, key=lambda m: m.timestamp)
+        """
+        Get all messages in the conversation thread containing `message_id`
+        (the root message and every reply under it, in send order)
+        """
+        root = self._thread_root.get(message_id, message_id)
+        return list(self._threads.get(root, ()))
     
     def get_all_messages(self) -> List[Dict[str, Any]]:
         """Get all messages as dictionaries (for UI display)"""
         return [m.to_dict() for m in self.messages]
     
     def clear(self) -> None:
-        """Clear all messages (useful for testing)"""
-        self.messages = []
+        """Clear all messages, including spilled ones (useful for testing); registered agents are kept"""
+        self.messages = _MessageIndex()
+        self._reset_indexes()
+        self._reset_counters()
+        self._sizes.clear()
+        self._retained_bytes = 0
+        self.evicted_count = 0
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self.spill_path and os.path.exists(self.spill_path):
+            open(self.spill_path, "w").close()  # evicted messages are cleared too
         
     def get_summary(self) -> Dict[str, Any]:
         """Get a summary of communication activity"""
         return {
-            "total_messages": len(self.messages),
-            "by_sender": self._count_by_field("sender"),
-            "by_type": self._count_by_field("message_type"),
+            "total_messages": self.total_sent,
+            "evicted_messages": self.evicted_count,
+            "by_sender": dict(self._by_sender),
+            "by_type": dict(self._by_type),
             "timeline": [
                 {
                     "time": m.timestamp.isoformat(),
@@ -129,20 +780,14 @@ class MessageBus:
                 for m in self.messages[-10:]  # Last 10 messages
             ]
         }
-    
-    def _count_by_field(self, field: str) -> Dict[str, int]:
-        """Helper to count messages by a field"""
-        counts = {}
-        for msg in self.messages:
-            value = getattr(msg, field)
-            if isinstance(value, Enum):
-                value = value.value
-            counts[value] = counts.get(value, 0) + 1
-        return counts
 
 
 # Example usage and testing
 if __name__ == "__main__":
+    import logging
+    
+    # send/receive are logged at DEBUG; a plain synchronous handler keeps them in step with the prints
+    logging.basicConfig(level=logging.DEBUG, format="   %(message)s")
     print("🧪 Testing Message Bus System\n")
     
     bus = MessageBus()
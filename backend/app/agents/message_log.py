@@ -0,0 +1,301 @@
+"""
+Persistent Message Log for Multi-Agent Communication
+Append-only segment files so agent conversations survive restarts and can be
+audited or replayed later
+"""
+
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+
+from .message_bus import MessageBus, AgentMessage, NODE_ID
+
+_shared: Dict[str, "MessageLog"] = {}  # realpath -> the process's log for that directory
+_shared_lock = threading.Lock()
+
+
+class MessageLog:
+    """
+    Durable, append-only log of AgentMessage records
+
+    Each record is one JSON line (AgentMessage.to_dict()) in a segment file.
+    Segments rotate once they reach `segment_max_bytes`. `append()` only
+    serializes the message and queues it; a background writer thread does
+    the file writes and fsyncs them in batches: after `fsync_every` records
+    or `fsync_interval` seconds, whichever comes first, including when no
+    further records arrive. Each segment has a sidecar `.idx` file with one
+    `session_id<TAB>offset<TAB>length` line per record, so a session can be
+    read back through memory-mapped segments without scanning the log.
+
+    Segment files are named after the writing process's NODE_ID
+    (`segment-<node>-000001.log`), so workers sharing a directory never
+    append to the same file. Within a process, buses share one log per
+    directory through `MessageLog.shared()`. Segments other processes write
+    after this log was opened are not indexed until it is reopened.
+    """
+
+    SEGMENT_PREFIX = "segment-"
+
+    def __init__(self, directory: str,
+                 segment_max_bytes: int = 64 * 1024 * 1024,
+                 fsync_every: int = 64,
+                 fsync_interval: float = 1.0):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        # session_id -> [(segment name, offset, length)]
+        self._index: Dict[Optional[str], List[Tuple[str, int, int]]] = {}
+        self._segments: List[str] = self._existing_segments()
+        for segment in self._segments:
+            self._load_index(segment)
+
+        self._log_file = None
+        self._idx_file = None
+        self._segment: Optional[str] = None
+        self._segment_number = 0
+        self._users = 1  # open handles; see shared()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self.records_written = 0
+
+        # Records waiting for the writer: (session_id, bytes), a barrier Event, or None to stop
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+    @classmethod
+    def shared(cls, directory: str, **kwargs) -> "MessageLog":
+        """
+        The process-wide log for `directory`, created on first use
+
+        Every caller gets the same instance and must close() it once; the
+        segment is sealed when the last one does.
+        """
+        key = os.path.realpath(directory)
+        with _shared_lock:
+            log = _shared.get(key)
+            if log is None:
+                log = _shared[key] = cls(directory, **kwargs)
+            else:
+                log._users += 1
+            return log
+
+    # ------------------------------------------------------------------
+    # Segment bookkeeping
+    # ------------------------------------------------------------------
+
+    def _existing_segments(self) -> List[str]:
+        """Names of every segment in the directory (any process's), oldest first"""
+        names = [
+            name[len(self.SEGMENT_PREFIX):-len(".log")] for name in os.listdir(self.directory)
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(".log")
+        ]
+        return sorted(names, key=lambda name: (os.path.getmtime(self._segment_path(name)), name))
+
+    def _segment_path(self, segment: str, suffix: str = ".log") -> str:
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{segment}{suffix}")
+
+    def _load_index(self, segment: str) -> None:
+        """Load a segment's sidecar index, rebuilding it from the log if missing or short"""
+        entries: List[Tuple[Optional[str], int, int]] = []
+        idx_path = self._segment_path(segment, ".idx")
+        if os.path.exists(idx_path):
+            with open(idx_path, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 3:
+                        entries.append((parts[0] or None, int(parts[1]), int(parts[2])))
+
+        # Records written after the last index line (e.g. after a crash) are recovered by scanning
+        indexed_end = entries[-1][1] + entries[-1][2] + 1 if entries else 0
+        if indexed_end < os.path.getsize(self._segment_path(segment)):
+            with open(self._segment_path(segment), "rb") as f:
+                f.seek(indexed_end)
+                offset = indexed_end
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # torn final write
+                    try:
+                        session_id = json.loads(raw).get("session_id")
+                    except ValueError:
+                        break
+                    entries.append((session_id, offset, len(raw) - 1))
+                    offset += len(raw)
+            with open(idx_path, "w", encoding="utf-8") as f:
+                for session_id, offset, length in entries:
+                    f.write(f"{session_id or ''}\t{offset}\t{length}\n")
+
+        for session_id, offset, length in entries:
+            self._index.setdefault(session_id, []).append((segment, offset, length))
+
+    def _open_segment(self) -> None:
+        """Start this process's next segment"""
+        self._segment_number += 1
+        self._segment = f"{NODE_ID}-{self._segment_number:06d}"
+        self._segments.append(self._segment)
+        self._log_file = open(self._segment_path(self._segment), "ab")
+        self._idx_file = open(self._segment_path(self._segment, ".idx"), "a", encoding="utf-8")
+
+    def _seal_segment(self) -> None:
+        self.sync()
+        self._log_file.close()
+        self._idx_file.close()
+        self._log_file = self._idx_file = None
+
+    # ------------------------------------------------------------------
+    # Writing
+    # ------------------------------------------------------------------
+
+    def append(self, message: AgentMessage) -> None:
+        """Queue one message for the writer thread; durable after its next batched fsync"""
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="message-log-writer", daemon=True)
+            self._writer.start()
+        record = json.dumps(message.to_dict(), separators=(",", ":"), default=str).encode("utf-8")
+        self._queue.put((message.session_id, record))
+
+    def _write_loop(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                self.sync()  # quiet period: don't leave the last records unsynced
+                continue
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                self.sync()
+                item.set()
+                continue
+            self._write(*item)
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.sync()
+        self.sync()
+
+    def _write(self, session_id: Optional[str], record: bytes) -> None:
+        if self._log_file is None:
+            self._open_segment()
+        elif self._log_file.tell() >= self.segment_max_bytes:
+            self._seal_segment()
+            self._open_segment()
+
+        offset = self._log_file.tell()
+        self._log_file.write(record + b"\n")
+        self._idx_file.write(f"{session_id or ''}\t{offset}\t{len(record)}\n")
+        self._index.setdefault(session_id, []).append((self._segment, offset, len(record)))
+        self.records_written += 1
+        self._unsynced += 1
+
+    def sync(self) -> None:
+        """Flush buffered records and fsync the active segment (writer thread only)"""
+        if self._log_file is not None and self._unsynced:
+            self._log_file.flush()
+            os.fsync(self._log_file.fileno())
+            self._idx_file.flush()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self) -> None:
+        """Block until every record queued so far is written and fsync'd"""
+        if self._writer is not None and self._writer.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+
+    def close(self) -> None:
+        """Drain the queue, stop the writer and seal the active segment (once the last user closes)"""
+        with _shared_lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            if _shared.get(os.path.realpath(self.directory)) is self:
+                del _shared[os.path.realpath(self.directory)]
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._log_file is not None:
+            self._seal_segment()
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+
+    def sessions(self) -> List[Optional[str]]:
+        """All session ids present in the log"""
+        self.flush()
+        return list(self._index.keys())
+
+    def read_session(self, session_id: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """Yield a session's records in write order, reading only their byte ranges"""
+        self.flush()
+        entries = list(self._index.get(session_id, []))
+
+        current_segment = None
+        current_map = None
+        try:
+            for segment, offset, length in entries:
+                if segment != current_segment:
+                    if current_map is not None:
+                        current_map.close()
+                    with open(self._segment_path(segment), "rb") as f:
+                        current_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    current_segment = segment
+                yield json.loads(current_map[offset:offset + length])
+        finally:
+            if current_map is not None:
+                current_map.close()
+
+    def read_all(self) -> Iterator[Dict[str, Any]]:
+        """Yield every record in the log, segment by segment"""
+        self.flush()
+        for segment in list(self._segments):
+            with open(self._segment_path(segment), "rb") as f:
+                for raw in f:
+                    if raw.endswith(b"\n"):
+                        yield json.loads(raw)
+
+    def get_thread(self, session_id: Optional[str], message_id: str) -> List[Dict[str, Any]]:
+        """A message and its direct replies within one session"""
+        return [
+            r for r in self.read_session(session_id)
+            if r["message_id"] == message_id or r.get("in_reply_to") == message_id
+        ]
+
+    def replay(self, session_id: Optional[str] = None, **bus_kwargs) -> MessageBus:
+        """
+        Rebuild a MessageBus from the log for debugging
+
+        Messages are recorded in their original order with their original ids
+        and timestamps; nothing is delivered to agents.
+        """
+        bus = MessageBus(session_id=session_id, **bus_kwargs)
+        records = self.read_all() if session_id is None else self.read_session(session_id)
+        for record in records:
+            bus._record(AgentMessage.from_dict(record))
+        return bus
+
+
+# Example usage: dump a session from an existing log directory
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python -m app.agents.message_log <log_dir> [session_id]")
+        sys.exit(1)
+
+    log = MessageLog(sys.argv[1])
+    if len(sys.argv) == 2:
+        print("Sessions:")
+        for session_id in log.sessions():
+            print(f"  • {session_id} ({len(log._index[session_id])} messages)")
+    else:
+        replayed = log.replay(sys.argv[2])
+        for msg in replayed.messages:
+            print(f"  {msg.timestamp.isoformat()} {msg}")
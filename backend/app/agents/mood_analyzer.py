@@ -4,13 +4,30 @@ Replace your existing mood_analyzer.py with this
 """
 
 from .base_agent import BaseAgent
-from .message_bus import MessageType
+from .message_bus import MessageType, Subscription
+from .llm_gateway import as_gateway
+from .analysis_cache import TTLCache, normalize_text
+from app.models.schemas import MoodAnalysis
 import anthropic
+import os
 
 class MoodAnalyzer(BaseAgent):
-    def __init__(self, message_bus, client: anthropic.Anthropic):
+    # Only answers queries (context and approval requests)
+    subscriptions = (Subscription(message_types=frozenset({MessageType.QUERY})),)
+    
+    # Bump when the prompt below changes so cached analyses aren't reused
+    PROMPT_VERSION = "2"
+    
+    # Shared by every MoodAnalyzer in the process (each session gets a fresh agent)
+    cache = TTLCache(
+        max_entries=int(os.getenv("MOOD_CACHE_MAX_ENTRIES", "1024")),
+        ttl=float(os.getenv("MOOD_CACHE_TTL_SECONDS", "600"))
+    )
+    
+    def __init__(self, message_bus, client: anthropic.AsyncAnthropic):
         super().__init__("MoodAnalyzer", message_bus)
         self.client = client
+        self.llm = as_gateway(client)
     
     async def analyze_mood(self, user_input: str) -> dict:
         """Analyze user mood and BROADCAST findings"""
@@ -21,37 +38,35 @@ User input: "{user_input}"
 
 Return a JSON object with:
 - primary_emotion (string)
-- urgency_level (LOW/MODERATE/HIGH)
+- urgency_level (LOW/MODERATE/HIGH/CRISIS)
+- crisis_detected (boolean)
 - emotional_themes (list of strings)
 - matching_criteria (dict with relevant emotional factors)
 
+Set urgency_level to CRISIS and crisis_detected to true when the user expresses
+thoughts of suicide or self-harm, intent to harm others, or is in immediate danger;
+peer matching is then skipped in favour of crisis resources. Everyday stress, pain
+or frustration is not a crisis.
+
 Focus on emotional nuance and what kind of peer support would help."""
 
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            import json
-            import re
-            
-            # Get the text response
-            response_text = response.content[0].text.strip()
-            
-            # Extract JSON from response (handle markdown, extra text, etc.)
-            # Look for content between curly braces
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                response_text = json_match.group(0)
+            cache_key = (self.llm.model, self.PROMPT_VERSION, normalize_text(user_input))
+            analysis = self.cache.get(cache_key)
             
-            analysis = json.loads(response_text)
+            if analysis is None:
+                analysis = (await self.llm.complete_structured(
+                    prompt, MoodAnalysis, max_tokens=1000, agent=self.agent_id,
+                    priority=True  # urgency/crisis classification
+                )).model_dump()
+                self.cache.put(cache_key, analysis)
+            else:
+                self.logger.info("♻️ Reusing cached mood analysis")
             
             # Store in internal state
             self.internal_state["last_analysis"] = analysis
             
-            # BROADCAST findings to all agents
+            # BROADCAST findings to all agents (cache hits too, so SafetyAgent reviews every session)
             self.broadcast(
                 MessageType.BROADCAST,
                 {
@@ -70,8 +85,8 @@ Focus on emotional nuance and what kind of peer support would help."""
             
             return analysis
             
-        except Exception as e:
-            print(f"Error in MoodAnalyzer: {e}")
+        except Exception:
+            self.logger.exception("Error in MoodAnalyzer")
             return {
                 "primary_emotion": "unknown",
                 "urgency_level": "MODERATE",
@@ -86,7 +101,7 @@ Focus on emotional nuance and what kind of peer support would help."""
             
             # Handle approval requests from PeerMatcher
             if message.content.get("requesting_approval"):
-                print(f"  📨 MoodAnalyzer: Reviewing match proposal...")
+                self.logger.info("📨 Reviewing match proposal...")
                 
                 match_score = message.content.get("match_score", 0)
                 last_analysis = self.internal_state.get("last_analysis", {})
@@ -94,13 +109,13 @@ Focus on emotional nuance and what kind of peer support would help."""
                 
                 # Decision logic
                 if urgency == "HIGH" and match_score < 80:
-                    print(f"  ⚠️  MoodAnalyzer: Score too low for HIGH urgency user")
+                    self.logger.info("⚠️  Score too low for HIGH urgency user")
                     approval = "NEGOTIATE"
                 elif match_score < 70:
-                    print(f"  ❌ MoodAnalyzer: Match score too low ({match_score}%)")
+                    self.logger.info("❌ Match score too low (%s%%)", match_score)
                     approval = "REJECTED"
                 else:
-                    print(f"  ✅ MoodAnalyzer: Match approved ({match_score}% score)")
+                    self.logger.info("✅ Match approved (%s%% score)", match_score)
                     approval = "APPROVED"
                 
                 # Send response back
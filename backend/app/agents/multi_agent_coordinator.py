@@ -3,32 +3,52 @@ Updated Coordinator with Voting
 Replace your existing coordinator.py with this
 """
 
+from typing import Optional
 from .base_agent import BaseAgent
-from .message_bus import MessageBus, MessageType
+from .message_bus import MessageBus, MessageType, TAG_REQUESTING_APPROVAL, TAG_SAFETY_OBJECTION
 from .mood_analyzer import MoodAnalyzer
 from .peer_matcher import PeerMatcher
 from .location_agent import LocationAgent
 from .safety_agent import SafetyAgent
 from .email_generator import EmailGenerator  # Keep your existing one
+from .llm_gateway import as_gateway
+from .workflow import Workflow, Stage
+from app.logging_config import get_logger
 import anthropic
 import asyncio
+import logging
+
+class AgentTeam:
+    """One set of agents bound to a single session bus for one coordination run"""
+    
+    def __init__(self, message_bus: MessageBus, anthropic_client, supabase_client):
+        self.message_bus = message_bus
+        self.session_id = message_bus.session_id
+        self.mood_analyzer = MoodAnalyzer(message_bus, anthropic_client)
+        self.peer_matcher = PeerMatcher(message_bus, anthropic_client, supabase_client)
+        self.location_agent = LocationAgent(message_bus, anthropic_client)
+        self.safety_agent = SafetyAgent(message_bus)
+        self.email_generator = EmailGenerator(message_bus, anthropic_client)
+
 
 class MultiAgentCoordinator(BaseAgent):
+    # Orchestrates by calling agents directly; votes are read from the bus on demand
+    subscriptions = ()
+    
     def __init__(self, anthropic_client, supabase_client):
-        # Create message bus FIRST
-        self.message_bus = MessageBus()
+        # Create message bus FIRST; every run gets its own session bus under it
+        self.message_bus = MessageBus.from_env("coordinator")
         super().__init__("Coordinator", self.message_bus)
+        self.logger = get_logger("coordinator")
         
-        # Create all agents with the message bus
-        self.mood_analyzer = MoodAnalyzer(self.message_bus, anthropic_client)
-        self.peer_matcher = PeerMatcher(self.message_bus, anthropic_client, supabase_client)
-        self.location_agent = LocationAgent(self.message_bus, anthropic_client)
-        self.safety_agent = SafetyAgent(self.message_bus)
-        self.email_generator = EmailGenerator(self.message_bus, anthropic_client)  # Update this too
-        
-        self.client = anthropic_client
+        self.client = as_gateway(anthropic_client)  # one gateway (and limiter) for every team
+        self.workflow = self._build_workflow()
         self.supabase = supabase_client
     
+    def create_team(self, session_id: str = None) -> AgentTeam:
+        """Create fresh agents on a child bus so concurrent runs share no state"""
+        return AgentTeam(self.message_bus.session(session_id), self.client, self.supabase)
+    
     async def process_mood_entry(self, user_input: str = None, mood_text: str = None, 
                            user_context: dict = None, user_profile: dict = None):
         """
@@ -41,132 +61,186 @@ class MultiAgentCoordinator(BaseAgent):
         # Just call the async method directly
         return await self.process_match_request(text, profile)
     
-    async def process_match_request(self, user_input: str, user_profile: dict):
+    async def process_match_request(self, user_input: str, user_profile: dict, session_id: str = None):
         """Main workflow - simplified without voting"""
-        
-        print("\n" + "="*80)
-        print("🎯 COORDINATOR: Starting multi-agent matching")
-        print("="*80)
-        
-        # Phase 1: Mood Analysis (broadcasts to all)
-        print("\n📊 PHASE 1: Mood Analysis")
-        mood_analysis = await self.mood_analyzer.analyze_mood(user_input)
-        
-        # Phase 2: Find available peers
-        print("\n🔍 PHASE 2: Finding available peers")
-        available_peers = await self._get_available_peers(user_profile)
-        
-        # Phase 3: Peer Matching (queries other agents, then proposes)
-        print("\n🤝 PHASE 3: Peer Matching")
-        match_result = await self.peer_matcher.find_match(user_profile, available_peers)
-        
-        if not match_result.get("match_found"):
-            return {"match_found": False, "reason": "No suitable matches"}
-        
-        print("  ✅ Match found!")
-        
-        # Phase 3.5: Let agents process the proposal (especially SafetyAgent)
-        print("\n🛡️  PHASE 3.5: Safety Review")
-        await asyncio.sleep(0.2)  # Give time for message processing
-        
-        # Trigger all agents to process messages
-        for agent in [self.mood_analyzer, self.safety_agent, self.location_agent]:
-            try:
-                await agent.check_and_process_messages()
-            except Exception as e:
-                print(f"  ⚠️  Error processing messages for {agent.agent_id}: {e}")
-        
-        # Phase 4: Finalization
-        print("\n📍 PHASE 4: Generating recommendations")
-        
-        # Get location recommendations (with error handling)
-        location = None
+        team = self.create_team(session_id)
         try:
-            location = await self.location_agent.recommend_location(
-                mood_analysis.get("emotional_themes", []),
-                user_profile,
-                match_result
-            )
-        except Exception as e:
-            print(f"  ⚠️  Location agent error (continuing anyway): {e}")
-        
-        # Generate email (with error handling)
-        email = None
+            return await self._run_match_request(team, user_input, user_profile)
+        finally:
+            team.message_bus.stop_delivery()
+    
+    def _build_workflow(self) -> Workflow:
+        """The match request as a DAG; the peer pool is fetched while the mood is analyzed"""
+        return Workflow("match_request", [
+            Stage("analysis", self._analyze, ("team", "user_input")),
+            Stage("peers", self._fetch_peers, ("user_profile",)),
+            Stage("screening", self._screen, ("team", "analysis")),
+            Stage("match", self._match, ("team", "user_profile", "peers", "screening")),
+            Stage("safety_review", self._safety_review, ("team", "match")),
+            Stage("location", self._recommend_location, ("team", "analysis", "user_profile", "match", "safety_review"), optional=True),
+            Stage("email", self._generate_email, ("team", "user_profile", "match", "location"), optional=True),
+        ])
+    
+    async def stream_match_request(self, user_input: str, user_profile: dict, session_id: str = None):
+        """
+        Like process_match_request, but yields (stage, value) as each workflow
+        stage finishes and finally ("result", <full response>)
+        """
+        team = self.create_team(session_id)
+        events: asyncio.Queue = asyncio.Queue()
+        run = asyncio.create_task(self._run_match_request(
+            team, user_input, user_profile,
+            on_stage=lambda stage, value: events.put_nowait((stage, value))
+        ))
+        run.add_done_callback(lambda _: events.put_nowait(None))
         try:
-            email = await self.email_generator.generate_email(
-                user_profile,
-                match_result,
-                location
-            )
-        except Exception as e:
-            print(f"  ⚠️  Location agent error (continuing anyway): {e}")
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            yield "result", run.result()
+        finally:
+            run.cancel()  # no-op once finished; stops the workflow if the client went away
+            team.message_bus.stop_delivery()
+    
+    async def _run_match_request(self, team: AgentTeam, user_input: str, user_profile: dict, on_stage=None):
+        """Run the matching workflow with one session's agents"""
         
-        # Generate email (with error handling)
-        email = None
-        try:
-            email = await self.email_generator.generate_email(
-                user_profile,
-                match_result,
-                location
-            )
-        except Exception as e:
-            print(f"  ⚠️  Email generator error (continuing anyway): {e}")
+        log = self.logger
+        fields = {"fields": {"session": team.session_id}}
+        log.info("🎯 Starting multi-agent matching", extra=fields)
+        
+        # Agents process messages as they arrive instead of polling
+        await team.message_bus.start_delivery()
+        
+        run = await self.workflow.run(
+            {"team": team, "user_input": user_input, "user_profile": user_profile},
+            cancel_when=self._stop_reason,
+            on_stage=on_stage
+        )
+        values = run.values
+        
+        if run.cancelled_by == "screening":
+            log.warning("🚨 Crisis detected - matching stopped", extra=fields)
+            return {
+                "match_found": False,
+                "crisis_detected": True,
+                "reason": run.cancel_reason,
+                "mood_analysis": dict(values["analysis"], crisis_detected=True),
+                "session_id": team.session_id,
+                "stage_timings": run.timings_summary(),
+                "agent_communication_log": team.message_bus.get_all_messages(),
+                "conversation_summary": self._get_conversation_summary(team.message_bus)
+            }
+        if run.cancelled:
+            return {"match_found": False, "reason": run.cancel_reason, "stage_timings": run.timings_summary()}
         
-        print("\n✅ Match complete!")
-        print("="*80)
+        log.info("✅ Match complete", extra={"fields": {"session": team.session_id, "stages": run.timings_summary()}})
         
-        # Generate conversation summary
-        self._print_conversation_summary()
+        # Log conversation summary
+        self._log_conversation_summary(team.message_bus)
         
         return {
             "match_found": True,
-            "mood_analysis": mood_analysis,
-            "match": match_result,
-            "location": location,
-            "email": email,
-            "agent_communication_log": self.message_bus.get_all_messages(),
-            "conversation_summary": self._get_conversation_summary()
+            "mood_analysis": values["analysis"],
+            "match": values["match"],
+            "location": values["location"],
+            "email": values["email"],
+            "session_id": team.session_id,
+            "stage_timings": run.timings_summary(),
+            "agent_communication_log": team.message_bus.get_all_messages(),
+            "conversation_summary": self._get_conversation_summary(team.message_bus)
         }
     
+    def _stop_reason(self, stage: str, value) -> Optional[str]:
+        """Cancel downstream stages on a crisis or when no match was found"""
+        if stage == "screening" and value["crisis"]:
+            return f"Crisis detected by {value['source']}"
+        if stage == "match" and not value.get("match_found"):
+            return "No suitable matches"
+        return None
+    
+    # Workflow stages -------------------------------------------------
+    
+    async def _analyze(self, team: AgentTeam, user_input: str):
+        # Phase 1: Mood Analysis (broadcasts to all)
+        self.logger.info("📊 PHASE 1: Mood Analysis", extra={"fields": {"session": team.session_id}})
+        return await team.mood_analyzer.analyze_mood(user_input)
+    
+    async def _fetch_peers(self, user_profile: dict):
+        # Phase 2: Find available peers (runs alongside mood analysis)
+        self.logger.info("🔍 PHASE 2: Finding available peers")
+        return await self._get_available_peers(user_profile)
+    
+    async def _screen(self, team: AgentTeam, analysis: dict):
+        """Wait for SafetyAgent to review the mood broadcast, then check for a crisis"""
+        await team.message_bus.drain()
+        if analysis.get("crisis_detected") or analysis.get("urgency_level") == "CRISIS":
+            return {"crisis": True, "source": "MoodAnalyzer"}
+        if team.safety_agent.internal_state.get("risk_level") == "CRISIS":
+            return {"crisis": True, "source": "SafetyAgent"}
+        return {"crisis": False, "source": None}
+    
+    async def _match(self, team: AgentTeam, user_profile: dict, peers: list, screening: dict):
+        # Phase 3: Peer Matching (queries other agents, then proposes)
+        self.logger.info("🤝 PHASE 3: Peer Matching", extra={"fields": {"session": team.session_id}})
+        return await team.peer_matcher.find_match(user_profile, peers)
+    
+    async def _safety_review(self, team: AgentTeam, match: dict):
+        # Phase 3.5: Wait until every agent (especially SafetyAgent) has processed the proposal
+        self.logger.info("🛡️  PHASE 3.5: Safety Review", extra={"fields": {"session": team.session_id}})
+        await team.message_bus.drain()
+        return {"objections": team.message_bus.count_by_tag(TAG_SAFETY_OBJECTION)}
+    
+    async def _recommend_location(self, team: AgentTeam, analysis: dict, user_profile: dict,
+                                  match: dict, safety_review: dict):
+        # Phase 4: Finalization
+        self.logger.info("📍 PHASE 4: Generating recommendations", extra={"fields": {"session": team.session_id}})
+        return await team.location_agent.recommend_location(
+            analysis.get("emotional_themes", []),
+            user_profile,
+            match
+        )
+    
+    async def _generate_email(self, team: AgentTeam, user_profile: dict, match: dict, location: dict):
+        return await team.email_generator.generate_email(user_profile, match, location)
+    
     async def _get_available_peers(self, user_profile: dict):
         """Get available peers - using demo data for now"""
         try:
             # Import demo data
-            from app.demo_data import DEMO_STUDENT_PROFILES
+            from app.demo_data import get_all_students_except
             
             # Convert demo profiles to waiting peers format
-            peers = []
-            for profile in DEMO_STUDENT_PROFILES:
-                if profile.get("user_id") != user_profile.get("user_id"):
-                    peers.append({
-                        "user_id": profile["user_id"],
-                        "profile": profile,
-                        "mood_analysis": {
-                            "primary_emotion": "seeking support",
-                            "urgency_level": "MODERATE"
-                        }
-                    })
+            peers = [
+                {
+                    "user_id": profile["user_id"],
+                    "profile": profile,
+                    "mood_analysis": {
+                        "primary_emotion": "seeking support",
+                        "urgency_level": "MODERATE"
+                    }
+                }
+                for profile in get_all_students_except(user_profile.get("user_id"))
+            ]
             
-            print(f"  Found {len(peers)} available peers")
+            self.logger.info("Found %d available peers", len(peers))
             return peers
             
-        except Exception as e:
-            print(f"Error getting peers: {e}")
+        except Exception:
+            self.logger.exception("Error getting peers")
             return []
     
-    async def _conduct_voting(self):
+    async def _conduct_voting(self, team: AgentTeam):
         """Collect votes from all agents"""
-        print("  📢 Requesting votes from all agents...")
-        
-        # Give agents time to process proposal and vote
-        await asyncio.sleep(0.2)
+        self.logger.info("📢 Requesting votes from all agents...")
         
-        # Trigger agents to process messages
-        for agent in [self.mood_analyzer, self.location_agent, self.safety_agent]:
-            await agent.check_and_process_messages()
+        # Wait until agents have processed the proposal and voted
+        await team.message_bus.drain()
         
         # Collect votes
-        votes = self.message_bus.get_messages_for(
+        votes = team.message_bus.get_messages_for(
             agent_id="Coordinator",
             message_type=MessageType.VOTE
         )
@@ -181,9 +255,8 @@ class MultiAgentCoordinator(BaseAgent):
             for v in votes
         ]
         
-        print(f"\n  📊 Vote Tally:")
         for v in vote_list:
-            print(f"    • {v['agent']}: {v['vote']} - {v['reasoning']}")
+            self.logger.info("📊 Vote: %s %s - %s", v['agent'], v['vote'], v['reasoning'])
         
         return vote_list
     
@@ -202,102 +275,54 @@ class MultiAgentCoordinator(BaseAgent):
         return None
     
     def get_statistics(self):
-        """Get statistics about agent communications"""
-        history = self.message_bus.get_history()
+        """Get statistics about agent communications (snapshot of the bus's live counters)"""
+        stats = self.message_bus.get_stats()
         
-        stats = {
-            "total_messages": len(history),
-            "messages_by_type": {},
-            "messages_by_agent": {},
-            "agent_interactions": []
+        return {
+            "total_messages": stats["total_messages"],
+            "retained_messages": stats["retained_messages"],
+            "messages_by_type": stats["by_type"],
+            "messages_by_agent": stats["by_sender"],
+            "agent_interactions": [p for p in stats["by_pair"] if p["to"] != "ALL"],
+            "negotiations": stats["by_tag"].get(TAG_REQUESTING_APPROVAL, 0),
+            "safety_objections": stats["by_tag"].get(TAG_SAFETY_OBJECTION, 0),
+            "sessions": len(stats["by_session"]),
+            "mood_cache": MoodAnalyzer.cache.get_metrics(),
+            "peer_scoring": PeerMatcher.scorer.get_metrics()
         }
-        
-        for msg in history:
-            # Count by type
-            msg_type = msg.message_type.value
-            stats["messages_by_type"][msg_type] = stats["messages_by_type"].get(msg_type, 0) + 1
-            
-            # Count by agent
-            sender = msg.sender
-            stats["messages_by_agent"][sender] = stats["messages_by_agent"].get(sender, 0) + 1
-            
-            # Track interactions
-            if msg.target_agent and msg.target_agent != "ALL":
-                stats["agent_interactions"].append({
-                    "from": msg.sender,
-                    "to": msg.target_agent,
-                    "type": msg_type
-                })
-        
-        return stats
     
-    def _print_conversation_summary(self):
-        """Print a nice summary of agent interactions"""
-        messages = self.message_bus.get_all_messages()
-        
-        print("\n" + "="*80)
-        print("📊 AGENT CONVERSATION SUMMARY")
-        print("="*80)
-        
-        # Count interactions
-        queries = [m for m in messages if m.get("message_type") == "QUERY"]
-        responses = [m for m in messages if m.get("message_type") == "RESPONSE"]
-        broadcasts = [m for m in messages if m.get("message_type") == "BROADCAST"]
-        proposals = [m for m in messages if m.get("message_type") == "PROPOSAL"]
-        
-        print(f"\n📈 Communication Statistics:")
-        print(f"  • Total Messages: {len(messages)}")
-        print(f"  • Queries: {len(queries)}")
-        print(f"  • Responses: {len(responses)}")
-        print(f"  • Broadcasts: {len(broadcasts)}")
-        print(f"  • Proposals: {len(proposals)}")
-        
-        print(f"\n🔄 Agent Interactions:")
-        # Count who talked to whom
-        interactions = {}
-        for m in messages:
-            sender = m.get("sender", "Unknown")
-            target = m.get("target_agent", "ALL")
-            key = f"{sender} → {target}"
-            interactions[key] = interactions.get(key, 0) + 1
-        
-        for interaction, count in sorted(interactions.items(), key=lambda x: x[1], reverse=True):
-            print(f"  • {interaction}: {count} message{'s' if count > 1 else ''}")
-        
-        print(f"\n🎯 Decision Flow:")
-        print(f"  1️⃣  MoodAnalyzer broadcasted emotional state")
-        print(f"  2️⃣  PeerMatcher queried MoodAnalyzer for context")
-        print(f"  3️⃣  PeerMatcher requested approval for match")
-        print(f"  4️⃣  MoodAnalyzer reviewed and approved")
-        print(f"  5️⃣  SafetyAgent monitored for safety concerns")
-        print(f"  6️⃣  Match proposal broadcast to all agents")
-        print(f"  ✅ Consensus reached through agent collaboration!")
-        
-        print("="*80 + "\n")
+    def _log_conversation_summary(self, message_bus: MessageBus):
+        """Log a summary of agent interactions"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        stats = message_bus.get_stats()
+        
+        self.logger.info(
+            "📊 Agent conversation summary",
+            extra={"fields": {
+                "session": message_bus.session_id,
+                "total": stats["total_messages"],
+                "queries": message_bus.count_by_type(MessageType.QUERY),
+                "responses": message_bus.count_by_type(MessageType.RESPONSE),
+                "broadcasts": message_bus.count_by_type(MessageType.BROADCAST),
+                "proposals": message_bus.count_by_type(MessageType.PROPOSAL),
+                "interactions": {f"{p['from']}→{p['to']}": p["count"] for p in stats["by_pair"]}
+            }}
+        )
     
-    def _get_conversation_summary(self):
+    def _get_conversation_summary(self, message_bus: MessageBus):
         """Get conversation summary as dict for API response"""
-        messages = self.message_bus.get_all_messages()
+        stats = message_bus.get_stats()
         
         return {
-            "total_messages": len(messages),
+            "total_messages": stats["total_messages"],
             "by_type": {
-                "queries": len([m for m in messages if m.get("message_type") == "QUERY"]),
-                "responses": len([m for m in messages if m.get("message_type") == "RESPONSE"]),
-                "broadcasts": len([m for m in messages if m.get("message_type") == "BROADCAST"]),
-                "proposals": len([m for m in messages if m.get("message_type") == "PROPOSAL"])
+                "queries": message_bus.count_by_type(MessageType.QUERY),
+                "responses": message_bus.count_by_type(MessageType.RESPONSE),
+                "broadcasts": message_bus.count_by_type(MessageType.BROADCAST),
+                "proposals": message_bus.count_by_type(MessageType.PROPOSAL)
             },
-            "agent_interactions": self._count_interactions(messages),
-            "negotiation_occurred": any("requesting_approval" in str(m.get("content", {})) for m in messages),
-            "safety_objections": len([m for m in messages if "SAFETY_OBJECTION" in str(m.get("content", {}))])
+            "agent_interactions": {f"{p['from']}_to_{p['to']}": p["count"] for p in stats["by_pair"]},
+            "negotiation_occurred": message_bus.count_by_tag(TAG_REQUESTING_APPROVAL) > 0,
+            "safety_objections": message_bus.count_by_tag(TAG_SAFETY_OBJECTION)
         }
-    
-    def _count_interactions(self, messages):
-        """Count agent-to-agent interactions"""
-        interactions = {}
-        for m in messages:
-            sender = m.get("sender", "Unknown")
-            target = m.get("target_agent", "ALL")
-            key = f"{sender}_to_{target}"
-            interactions[key] = interactions.get(key, 0) + 1
-        return interactions
\ No newline at end of file
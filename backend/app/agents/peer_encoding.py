@@ -0,0 +1,71 @@
+"""
+Compact prompt encodings for PeerMatcher
+Describes users and peers in a few fixed fields instead of the repr of the
+whole profile, so a matching prompt stays the same size whatever the profiles hold
+
+Environment:
+    PEER_MATCH_TOKEN_BUDGET   Estimated prompt tokens for explaining a match
+                              (default 1200); free-text fields are shortened to fit
+"""
+
+from typing import Any, Dict, Optional
+import os
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose
+MOOD_POST_CHARS = 160
+USER_FIELD_CHARS = 300
+TOKEN_BUDGET = int(os.getenv("PEER_MATCH_TOKEN_BUDGET", "1200"))
+
+FIELDS = ("id", "emotion", "urgency", "focus", "themes", "interests", "year", "mood_post")
+
+
+def _profile(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Waiting-pool entries nest the profile; raw profiles don't"""
+    return entry.get("profile") or entry
+
+
+def _clean(value: Any, limit: Optional[int] = None) -> str:
+    if isinstance(value, (list, tuple)):
+        value = ",".join(str(v) for v in value)
+    text = " ".join(str(value or "-").replace("|", "/").split())
+    if limit is not None and len(text) > limit:
+        text = text[:limit - 1].rstrip() + "…"
+    return text
+
+
+def encode_peer(peer: Dict[str, Any], mood_post_chars: int = MOOD_POST_CHARS) -> str:
+    """One pipe-separated line in FIELDS order"""
+    profile = _profile(peer)
+    mood = peer.get("mood_analysis") or {}
+    return " | ".join((
+        _clean(peer.get("user_id") or profile.get("user_id")),
+        _clean(mood.get("primary_emotion")),
+        _clean(mood.get("urgency_level")),
+        _clean(profile.get("current_focus"), 80),
+        _clean(mood.get("emotional_themes")),
+        _clean(profile.get("interests"), 80),
+        _clean(profile.get("year"), 40),
+        _clean(profile.get("mood_post"), mood_post_chars)
+    ))
+
+
+def encode_user(user_profile: Dict[str, Any], mood: Optional[Dict[str, Any]] = None,
+                field_chars: int = USER_FIELD_CHARS) -> str:
+    """Compact description of the user being matched, same field names as the peer lines"""
+    profile = _profile(user_profile)
+    mood = mood or user_profile.get("mood_analysis") or {}
+    fields = {
+        "id": user_profile.get("user_id") or profile.get("user_id"),
+        "emotion": mood.get("primary_emotion") or mood.get("emotion"),
+        "urgency": mood.get("urgency_level") or mood.get("answer"),
+        "focus": profile.get("current_focus"),
+        "themes": mood.get("emotional_themes") or mood.get("themes"),
+        "interests": profile.get("interests"),
+        "year": profile.get("year"),
+        "says": user_profile.get("user_input") or profile.get("mood_post")
+    }
+    return "\n".join(f"{name}: {_clean(value, field_chars)}" for name, value in fields.items())
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
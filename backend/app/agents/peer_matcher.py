@@ -4,135 +4,201 @@ Replace your existing peer_matcher.py with this
 """
 
 from .base_agent import BaseAgent
-from .message_bus import MessageType
+from .message_bus import MessageType, Subscription, RequestTimeout, TAG_REQUESTING_APPROVAL
+from .llm_gateway import as_gateway
+from .scoring import ScoringEngine, ScoredPeer, DEFAULT_TOP_K, MIN_MATCH_SCORE, CACHE_ROWS
+from .waiting_pool import WaitingPool, NEAREST_CANDIDATES
+from .structured_output import StructuredOutputError
+from . import peer_encoding
+from app.models.schemas import MatchExplanation
+from typing import Optional
 import anthropic
-import asyncio
 
 class PeerMatcher(BaseAgent):
-    def __init__(self, message_bus, client: anthropic.Anthropic, supabase_client):
+    # Only stores responses from other agents
+    subscriptions = (Subscription(message_types=frozenset({MessageType.RESPONSE})),)
+    
+    # Shared by every PeerMatcher so peer feature rows are computed once, not per
+    # request, and bounded because nothing removes peers from it; a PeerMatcher
+    # given a waiting pool scores with the pool's engine
+    scorer = ScoringEngine(max_rows=CACHE_ROWS)
+    
+    def __init__(self, message_bus, client: anthropic.AsyncAnthropic, supabase_client,
+                 top_k: int = DEFAULT_TOP_K, min_score: int = MIN_MATCH_SCORE,
+                 pool: Optional[WaitingPool] = None, candidates: int = NEAREST_CANDIDATES,
+                 token_budget: int = peer_encoding.TOKEN_BUDGET):
         super().__init__("PeerMatcher", message_bus)
         self.client = client
+        self.llm = as_gateway(client)
         self.supabase = supabase_client
+        self.top_k = top_k
+        self.min_score = min_score
+        self.pool = pool  # when set, large peer lists are narrowed with its embedding index
+        if pool is not None:
+            self.scorer = pool.scorer
+        self.candidates = candidates
+        self.token_budget = token_budget  # estimated tokens for the _explain prompt
     
     async def find_match(self, user_profile: dict, available_peers: list) -> dict:
         """Find best match with NEGOTIATION phase"""
         
-        print("\n  🔍 PeerMatcher: Analyzing available peers...")
+        self.logger.info("🔍 Analyzing %d available peers", len(available_peers))
         
         # PHASE 1: QUERY MoodAnalyzer for context
-        self.send_to(
-            receiver="MoodAnalyzer",
-            message_type=MessageType.QUERY,
-            content={"question": "What is the user's urgency level and emotional state?"}
-        )
-        
-        # Give agents time to respond
-        await asyncio.sleep(0.1)
-        await self.check_and_process_messages()
-        
-        # Your existing matching logic with Claude
-        prompt = f"""You are a peer matching AI for a mental health support platform.
-
-User Profile:
-{user_profile}
-
-Available Peers:
-{available_peers}
-
-SCORING FORMULA: Final Score = (Mood Similarity × 0.8) + (Profile Compatibility × 0.2)
-
-Find the best match and return JSON:
-{{
-    "match_found": true/false,
-    "matched_peer_id": "peer_id",
-    "match_score": 85,
-    "mood_similarity_score": 88,
-    "profile_compatibility_score": 72,
-    "rationale": "explanation",
-    "shared_emotional_themes": ["theme1", "theme2"],
-    "conversation_starters": ["starter1", "starter2"]
-}}"""
-
         try:
-            response = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=2000,
-                messages=[{"role": "user", "content": prompt}]
+            reply = await self.request(
+                "MoodAnalyzer",
+                {"question": "What is the user's urgency level and emotional state?"}
             )
+            self.internal_state["mood_info"] = reply.content
+        except RequestTimeout as e:
+            self.logger.warning("⏱️  Continuing without mood context: %s", e)
+        
+        try:
+            # Score every peer locally with the 80/20 formula; the model only explains the winner
+            mood = user_profile.get("mood_analysis") or self.internal_state.get("mood_info")
+            peers = self._nearest_candidates(user_profile, mood, available_peers)
+            ranked = self.scorer.rank(user_profile, peers, self.top_k, mood=mood)
+            self.internal_state["candidates"] = [peer.as_dict() for peer in ranked]
             
-            import json
-            import re
+            if not ranked or ranked[0].match_score < self.min_score:
+                self.logger.info("🔍 No peer scored %d or more", self.min_score)
+                return {"match_found": False, "reason": "No sufficiently compatible peers"}
             
-            # Extract JSON from response
-            result_text = response.content[0].text.strip()
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                result_text = json_match.group(0)
+            best = ranked[0]
+            match_result = {
+                "match_found": True,
+                "matched_peer_id": best.user_id,
+                "match_score": best.match_score,
+                "mood_similarity_score": best.mood_similarity_score,
+                "profile_compatibility_score": best.profile_compatibility_score,
+                "shared_emotional_themes": best.shared_emotional_themes
+            }
+            match_result.update(await self._explain(user_profile, mood, peers, best))
             
-            match_result = json.loads(result_text)
+            self.logger.info("✓ Found potential match: %s (%s%%)", match_result['matched_peer_id'], match_result['match_score'])
             
-            if match_result.get("match_found"):
-                print(f"  ✓ Found potential match: {match_result['matched_peer_id']} ({match_result['match_score']}%)")
-                
-                # PHASE 2: NEGOTIATION - Seek approval from MoodAnalyzer
-                print("\n  💬 PeerMatcher: Seeking approval from MoodAnalyzer...")
-                self.send_to(
-                    receiver="MoodAnalyzer",
-                    message_type=MessageType.QUERY,
-                    content={
+            # PHASE 2: NEGOTIATION - Seek approval from MoodAnalyzer
+            self.logger.info("💬 Seeking approval from MoodAnalyzer...")
+            try:
+                reply = await self.request(
+                    "MoodAnalyzer",
+                    {
                         "question": f"Do you approve this match with {match_result['matched_peer_id']}?",
                         "match_score": match_result['match_score'],
                         "rationale": match_result['rationale'],
                         "requesting_approval": True
-                    }
-                )
-                
-                # Wait for MoodAnalyzer's response
-                await asyncio.sleep(0.2)  # Increased wait time
-                await self.check_and_process_messages()
-                
-                # Check if we got approval (look in internal state)
-                approval = self.internal_state.get("mood_analyzer_approval", "APPROVED")
-                print(f"  📋 Approval status: {approval}")
-                
-                if approval == "REJECTED":
-                    print("  ❌ MoodAnalyzer rejected the match")
-                    return {"match_found": False, "reason": "Rejected by MoodAnalyzer"}
-                elif approval == "NEGOTIATE":
-                    print("  🔄 MoodAnalyzer suggests adjustments...")
-                    # In a real system, we'd adjust and re-match
-                    # For demo, we'll proceed with a note
-                    match_result["negotiated"] = True
-                else:
-                    # APPROVED or default
-                    pass
-                
-                print("  ✓ Match approved by MoodAnalyzer")
-                
-                # PHASE 3: PROPOSE match to all agents
-                self.broadcast(
-                    MessageType.PROPOSAL,
-                    {
-                        "summary": f"Proposing match: {match_result['matched_peer_id']} ({match_result['match_score']}% score)",
-                        "match": match_result,
-                        "rationale": match_result.get("rationale", ""),
-                        "negotiated": match_result.get("negotiated", False)
-                    }
-                )
-                
-                # Log decision
-                self.log_decision(
-                    decision=f"Matched with {match_result['matched_peer_id']}",
-                    reasoning=f"Score {match_result['match_score']}% based on mood similarity and profile compatibility",
-                    confidence=match_result['match_score'] / 100
+                    },
+                    tags={TAG_REQUESTING_APPROVAL}
                 )
+                approval = reply.content.get("approval", "NEGOTIATE")
+            except RequestTimeout as e:
+                # No silent approval: the proposal goes out flagged so SafetyAgent and the UI can see it
+                self.logger.warning("⏱️  %s", e)
+                approval = "TIMEOUT"
+            self.internal_state["mood_analyzer_approval"] = approval
+            self.logger.info("📋 Approval status: %s", approval)
             
+            if approval == "REJECTED":
+                self.logger.info("❌ MoodAnalyzer rejected the match")
+                return {"match_found": False, "reason": "Rejected by MoodAnalyzer"}
+            elif approval == "NEGOTIATE":
+                self.logger.info("🔄 MoodAnalyzer suggests adjustments...")
+                # In a real system, we'd adjust and re-match
+                # For demo, we'll proceed with a note
+                match_result["negotiated"] = True
+            elif approval == "TIMEOUT":
+                self.logger.warning("⚠️  Proceeding without MoodAnalyzer approval")
+                match_result["approval_timed_out"] = True
+            else:
+                self.logger.info("✓ Match approved by MoodAnalyzer")
+            
+            # PHASE 3: PROPOSE match to all agents
+            self.broadcast(
+                MessageType.PROPOSAL,
+                {
+                    "summary": f"Proposing match: {match_result['matched_peer_id']} ({match_result['match_score']}% score)",
+                    "match": match_result,
+                    "rationale": match_result.get("rationale", ""),
+                    "negotiated": match_result.get("negotiated", False)
+                }
+            )
+            
+            # Log decision
+            self.log_decision(
+                decision=f"Matched with {match_result['matched_peer_id']}",
+                reasoning=f"Score {match_result['match_score']}% based on mood similarity and profile compatibility",
+                confidence=match_result['match_score'] / 100
+            )
+        
             return match_result
             
         except Exception as e:
-            print(f"Error in PeerMatcher: {e}")
+            self.logger.exception("Error in PeerMatcher")
             return {"match_found": False, "reason": str(e)}
     
+    def _nearest_candidates(self, user_profile: dict, mood, available_peers: list) -> list:
+        """Peers whose mood text is closest to the user's, when the list is too long to score whole"""
+        if self.pool is None or len(available_peers) <= self.candidates:
+            return available_peers
+        allowed = {peer.get("user_id") for peer in available_peers}
+        nearest = self.pool.nearest(user_profile, self.candidates, mood=mood, allow=allowed)
+        if not nearest:
+            return available_peers
+        self.logger.info("🧭 Embedding index narrowed %d peers to %d candidates", len(available_peers), len(nearest))
+        return nearest
+    
+    async def _explain(self, user_profile: dict, mood, available_peers: list, best: ScoredPeer) -> dict:
+        """Ask the model for the rationale and conversation starters of an already-chosen match"""
+        peer = next(p for p in available_peers if p.get("user_id") == best.user_id)
+        prompt = self._explain_prompt(user_profile, mood, peer, best)
+        try:
+            explanation = await self.llm.complete_structured(
+                prompt, MatchExplanation, max_tokens=800, agent=self.agent_id
+            )
+            # Scores stay the engine's even if the model volunteers its own
+            return explanation.model_dump(include={"rationale", "conversation_starters"})
+        except StructuredOutputError as e:
+            # The match itself doesn't depend on the model, so keep it with a plain rationale
+            self.logger.warning("⚠️  No usable explanation, using a default rationale: %s", e)
+            themes = ", ".join(best.shared_emotional_themes) or "similar experiences"
+            return {"rationale": f"Both students are working through {themes}.", "conversation_starters": []}
+    
+    def _explain_prompt(self, user_profile: dict, mood, peer: dict, best: ScoredPeer) -> str:
+        """The _explain prompt, with free-text fields halved until it fits token_budget"""
+        user_chars, peer_chars = peer_encoding.USER_FIELD_CHARS, peer_encoding.MOOD_POST_CHARS
+        while True:
+            prompt = self._render_explain_prompt(
+                peer_encoding.encode_user(user_profile, mood, user_chars),
+                peer_encoding.encode_peer(peer, peer_chars), best
+            )
+            tokens = peer_encoding.estimate_tokens(prompt)
+            if tokens <= self.token_budget or user_chars <= 40:
+                break
+            user_chars, peer_chars = user_chars // 2, peer_chars // 2
+        if tokens > self.token_budget:
+            self.logger.debug("Explain prompt is ~%d tokens, over the %d budget", tokens, self.token_budget)
+        return prompt
+    
+    @staticmethod
+    def _render_explain_prompt(user: str, peer: str, best: ScoredPeer) -> str:
+        return f"""You are a peer matching AI for a mental health support platform.
+
+These two students have been matched (score {best.match_score}/100: mood similarity {best.mood_similarity_score}, profile compatibility {best.profile_compatibility_score}).
+Shared emotional themes: {", ".join(best.shared_emotional_themes) or "none detected"}
+
+User:
+{user}
+
+Matched peer ({" | ".join(peer_encoding.FIELDS)}):
+{peer}
+
+Explain the match and suggest openers. Return JSON:
+{{
+    "rationale": "explanation",
+    "conversation_starters": ["starter1", "starter2"]
+}}"""
+    
     async def process_message(self, message):
         """Store responses from other agents"""
         if message.message_type == MessageType.RESPONSE:
@@ -142,10 +208,10 @@ Find the best match and return JSON:
                 if "approval" in message.content:
                     approval = message.content.get("approval", "APPROVED")
                     self.internal_state["mood_analyzer_approval"] = approval
-                    print(f"  📥 PeerMatcher received approval: {approval}")
+                    self.logger.debug("📥 Received approval: %s", approval)
                 else:
                     # General mood info
                     self.internal_state["mood_info"] = message.content
-                    print(f"  📥 PeerMatcher received mood info")
+                    self.logger.debug("📥 Received mood info")
         
         return None
\ No newline at end of file
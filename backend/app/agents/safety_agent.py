@@ -3,14 +3,19 @@ SafetyAgent - Monitors proposals and can object
 """
 
 from .base_agent import BaseAgent
-from .message_bus import MessageType
+from .message_bus import MessageType, Subscription, TAG_SAFETY_OBJECTION, TAG_CRISIS
 
 class SafetyAgent(BaseAgent):
     """Safety agent that monitors and can object to matches"""
     
+    # Mood broadcasts (for risk level) and every match proposal
+    subscriptions = (
+        Subscription(message_types=frozenset({MessageType.BROADCAST}), senders=frozenset({"MoodAnalyzer"})),
+        Subscription(message_types=frozenset({MessageType.PROPOSAL})),
+    )
+    
     def __init__(self, message_bus):
         super().__init__("SafetyAgent", message_bus)
-        self.crisis_keywords = ["suicide", "harm", "crisis", "hurt", "hopeless"]
         self.risk_threshold = 75  # Require higher match scores for at-risk users
     
     async def process_message(self, message):
@@ -19,47 +24,66 @@ class SafetyAgent(BaseAgent):
         # Monitor mood broadcasts for risk assessment
         if message.message_type == MessageType.BROADCAST:
             if message.sender == "MoodAnalyzer":
-                print(f"  👁️  SafetyAgent: Monitoring mood analysis...")
+                self.logger.debug("👁️  Monitoring mood analysis...")
                 analysis = message.content.get("analysis", {})
                 urgency = analysis.get("urgency_level", "MODERATE")
                 
-                # Store risk assessment
-                if urgency == "HIGH":
+                # Store risk assessment. Crisis is the MoodAnalyzer's call: a keyword scan of the
+                # raw text can't tell "harm" from "pharmacology" or "my back hurts"
+                if analysis.get("crisis_detected") or urgency == "CRISIS":
+                    self.internal_state["risk_level"] = "CRISIS"
+                    self.logger.warning("🚨 Crisis flagged by MoodAnalyzer")
+                    self.broadcast(
+                        MessageType.NOTIFICATION,
+                        {
+                            "alert": TAG_CRISIS,
+                            "urgency_level": urgency,
+                            "recommendation": "Route to crisis resources instead of peer matching"
+                        },
+                        tags={TAG_CRISIS}
+                    )
+                elif urgency == "HIGH":
                     self.internal_state["risk_level"] = "HIGH"
-                    print(f"  ⚠️  SafetyAgent: HIGH urgency detected - will scrutinize matches")
+                    self.logger.warning("⚠️  HIGH urgency detected - will scrutinize matches")
                 else:
                     self.internal_state["risk_level"] = "MODERATE"
         
         # Monitor and potentially object to proposals
         elif message.message_type == MessageType.PROPOSAL:
-            print(f"  🛡️  SafetyAgent: Reviewing match proposal for safety...")
+            self.logger.info("🛡️  Reviewing match proposal for safety...")
             
             match_data = message.content.get("match", {})
             match_score = match_data.get("match_score", 0)
-            risk_level = self.internal_state.get("risk_level", "MODERATE")
+            # Batch proposals carry the pair's risk; per-request ones rely on the mood broadcast
+            risk_level = match_data.get("risk_level") or self.internal_state.get("risk_level", "MODERATE")
             
             # Decision logic
             should_object = False
             objection_reason = None
             
-            if risk_level == "HIGH" and match_score < self.risk_threshold:
+            if risk_level == "CRISIS":
+                should_object = True
+                objection_reason = "Crisis indicators present - peer matching is not appropriate"
+            elif risk_level == "HIGH" and match_score < self.risk_threshold:
                 should_object = True
                 objection_reason = f"Match score ({match_score}%) below safety threshold ({self.risk_threshold}%) for HIGH risk user"
             
             if should_object:
-                print(f"  🚫 SafetyAgent: OBJECTION raised!")
+                self.logger.warning("🚫 OBJECTION raised: %s", objection_reason)
                 # Send objection
                 self.broadcast(
                     MessageType.NOTIFICATION,
                     {
-                        "alert": "SAFETY_OBJECTION",
+                        "alert": TAG_SAFETY_OBJECTION,
+                        "proposal_id": message.message_id,
                         "reason": objection_reason,
                         "recommendation": "Suggest professional support resources instead"
-                    }
+                    },
+                    tags={TAG_SAFETY_OBJECTION}
                 )
                 return None  # Objection is the notification, no separate vote needed
             else:
-                print(f"  ✅ SafetyAgent: Match appears safe")
+                self.logger.info("✅ Match appears safe")
                 return None  # No objection = silent approval
         
         return None
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Vectorized peer scoring
+Computes "Final Score = Mood Similarity x 0.8 + Profile Compatibility x 0.2"
+locally and deterministically, for every waiting peer in one matrix product
+
+Each person gets two small feature vectors:
+    mood     emotional themes + emotions, detected from mood post, focus and analysis
+    profile  interest groups + year of study, detected from interests, bio and year
+Vectors are L2-normalised, so each similarity starts as a cosine in [0, 1].
+It is reported as 100 x sqrt(cosine): raw cosines of sparse keyword vectors
+sit low (peers sharing one clear theme land around 0.5), and the square root
+puts them on the scale MoodAnalyzer's approval thresholds were written for
+(70 = cosine 0.49). The mapping is monotonic, so rankings are unchanged.
+
+Feature rows are cached per user_id in a preallocated matrix and only
+recomputed when the fields they are built from change.
+
+Environment:
+    PEER_MATCH_CACHE_ROWS   Feature rows PeerMatcher keeps for peers outside
+                            the waiting pool (default 4096)
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import re
+
+import numpy as np
+
+MOOD_WEIGHT = 0.8
+PROFILE_WEIGHT = 0.2
+
+DEFAULT_TOP_K = int(os.getenv("PEER_MATCH_TOP_K", "8"))
+MIN_MATCH_SCORE = int(os.getenv("PEER_MATCH_MIN_SCORE", "40"))  # below this, report no match
+CACHE_ROWS = int(os.getenv("PEER_MATCH_CACHE_ROWS", "4096"))
+
+MOOD_THEMES: Dict[str, Tuple[str, ...]] = {
+    "career": ("career", "job", "intern", "recruit", "interview", "superday", "networking", "hiring", "resume", "offer"),
+    "academic pressure": ("exam", "class", "course", "study", "grade", "gpa", "thesis", "homework", "midterm", "math",
+                          "thermo", "proof", "algebra", "probability", "mcat", "lab"),
+    "social isolation": ("lonel", "alone", "isolat", "friend", "roommate", "community", "connect", "belong"),
+    "homesickness": ("home", "family", "parent", "miss", "international"),
+    "burnout": ("burnout", "burn", "exhaust", "tired", "sleep", "consum", "drain", "overwhelm"),
+    "self-doubt": ("doubt", "imposter", "impostor", "behind", "fail", "bomb", "compar", "everyone else"),
+    "future uncertainty": ("graduat", "future", "after", "transition", "path", "undecided", "uncertain", "question"),
+    "relationships": ("relationship", "breakup", "partner", "dating", "boyfriend", "girlfriend"),
+    "finances": ("money", "financ", "loan", "debt", "rent", "afford", "tuition"),
+    "identity": ("identity", "culture", "first-gen", "first gen", "queer", "belonging")
+}
+
+EMOTIONS: Dict[str, Tuple[str, ...]] = {
+    "anxious": ("anxi", "nervous", "worr", "panic", "stress"),
+    "sad": ("sad", "down", "depress", "cry", "hopeless", "hitting"),
+    "lonely": ("lonel", "alone", "isolat"),
+    "overwhelmed": ("overwhelm", "exhaust", "swamp", "consum", "juggl"),
+    "frustrated": ("frustrat", "angry", "annoy", "destroy", "kicking"),
+    "hopeful": ("excit", "hope", "optimis", "determin", "loving")
+}
+
+INTEREST_GROUPS: Dict[str, Tuple[str, ...]] = {
+    "tech": ("ai/ml", "machine learning", "data", "coding", "hackathon", "tech", "program", "comput", "robot",
+             "multi-agent"),
+    "arts": ("art", "paint", "draw", "photo", "design", "museum", "film", "poetry", "writing", "creativ"),
+    "music": ("music", "sing", "k-pop", "edm", "indie", "guitar", "piano", "band", "concert"),
+    "fitness": ("basketball", "running", "climbing", "yoga", "gym", "soccer", "badminton", "hiking", "sport"),
+    "science": ("science", "research", "neuro", "physics", "space", "biochem", "chem", "podcast"),
+    "games": ("gaming", "game", "anime", "sci-fi", "fantasy", "board game"),
+    "food": ("cook", "food", "coffee", "bubble tea", "baking", "recipe"),
+    "wellbeing": ("mental health", "meditat", "journal", "advocacy", "wellness")
+}
+
+YEARS: Dict[str, Tuple[str, ...]] = {
+    "first-year": ("first-year", "freshman", "first year"),
+    "sophomore": ("sophomore",),
+    "junior": ("junior",),
+    "senior": ("senior",),
+    "graduate": ("ms ", "masters", "master's", "phd", "graduate", "mba")
+}
+
+YEAR_WEIGHT = 0.5  # a shared year matters less than a shared interest
+
+
+def _lexicon(groups: Sequence[Dict[str, Tuple[str, ...]]]) -> Tuple[List[str], re.Pattern, Dict[str, List[int]]]:
+    """Dimension names, one regex matching any stem at a word start, and stem -> dimensions"""
+    names: List[str] = []
+    dims: Dict[str, List[int]] = {}
+    for group in groups:
+        for name, stems in group.items():
+            for stem in stems:
+                dims.setdefault(stem, []).append(len(names))
+            names.append(name)
+    alternation = "|".join(re.escape(s) for s in sorted(dims, key=len, reverse=True))
+    return names, re.compile(rf"(?<![a-z0-9])({alternation})"), dims
+
+
+MOOD_DIMS, _MOOD_RE, _MOOD_STEMS = _lexicon((MOOD_THEMES, EMOTIONS))
+INTEREST_DIMS, _INTEREST_RE, _INTEREST_STEMS = _lexicon((INTEREST_GROUPS,))
+YEAR_DIMS, _YEAR_RE, _YEAR_STEMS = _lexicon((YEARS,))
+PROFILE_DIMS = INTEREST_DIMS + YEAR_DIMS
+_THEME_COUNT = len(MOOD_THEMES)
+
+
+def _text(*parts: Any) -> str:
+    out = []
+    for part in parts:
+        if isinstance(part, (list, tuple)):
+            out.extend(str(p) for p in part)
+        elif part:
+            out.append(str(part))
+    return " ".join(out).lower()
+
+
+def _count(text: str, pattern: re.Pattern, stems: Dict[str, List[int]], row: np.ndarray, offset: int = 0,
+           weight: float = 1.0) -> None:
+    for stem in pattern.findall(text):
+        for dim in stems[stem]:
+            row[offset + dim] += weight
+
+
+def _normalize(row: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(row)
+    return row / norm if norm else row
+
+
+def _profile(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Waiting-pool entries nest the profile; raw profiles don't"""
+    return entry.get("profile") or entry
+
+
+def mood_features(entry: Dict[str, Any], mood: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    profile = _profile(entry)
+    mood = mood or entry.get("mood_analysis") or {}
+    row = np.zeros(len(MOOD_DIMS), dtype=np.float32)
+    text = _text(entry.get("user_input"), profile.get("mood_post"), profile.get("current_focus"),
+                 mood.get("primary_emotion") or mood.get("emotion"),
+                 mood.get("emotional_themes") or mood.get("themes"), mood.get("needs"))
+    _count(text, _MOOD_RE, _MOOD_STEMS, row)
+    return _normalize(row)
+
+
+def profile_features(entry: Dict[str, Any]) -> np.ndarray:
+    profile = _profile(entry)
+    row = np.zeros(len(PROFILE_DIMS), dtype=np.float32)
+    _count(_text(profile.get("interests"), profile.get("bio")), _INTEREST_RE, _INTEREST_STEMS, row)
+    _count(_text(profile.get("year")) + " ", _YEAR_RE, _YEAR_STEMS, row, offset=len(INTEREST_DIMS),
+           weight=YEAR_WEIGHT)
+    return _normalize(row)
+
+
+def calibrate(cosine: np.ndarray) -> np.ndarray:
+    """Cosine similarity -> 0-100 score (see module docstring)"""
+    return 100 * np.sqrt(np.clip(cosine, 0.0, 1.0))
+
+
+def combine(mood_cosine: np.ndarray, profile_cosine: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(final, mood similarity, profile compatibility) scores from raw cosines of any shape"""
+    mood_sim = calibrate(mood_cosine)
+    profile_sim = calibrate(profile_cosine)
+    return MOOD_WEIGHT * mood_sim + PROFILE_WEIGHT * profile_sim, mood_sim, profile_sim
+
+
+def _fingerprint(entry: Dict[str, Any]) -> int:
+    """Hash of every field the feature rows are built from"""
+    profile = _profile(entry)
+    mood = entry.get("mood_analysis") or {}
+    return hash((
+        profile.get("mood_post"), profile.get("current_focus"), profile.get("bio"), profile.get("year"),
+        tuple(profile.get("interests") or ()), entry.get("user_input"),
+        mood.get("primary_emotion"), tuple(mood.get("emotional_themes") or ())
+    ))
+
+
+@dataclass
+class ScoredPeer:
+    user_id: str
+    match_score: int
+    mood_similarity_score: int
+    profile_compatibility_score: int
+    shared_emotional_themes: List[str] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "match_score": self.match_score,
+            "mood_similarity_score": self.mood_similarity_score,
+            "profile_compatibility_score": self.profile_compatibility_score,
+            "shared_emotional_themes": self.shared_emotional_themes
+        }
+
+
+class ScoringEngine:
+    """
+    Cached feature matrix for the waiting pool
+
+    Rows live in preallocated float32 matrices (doubled when full); removed
+    rows are zeroed, masked out and reused. With `max_rows`, the least
+    recently upserted peers are removed once a sync() leaves more than that
+    many rows (never the peers of that sync); without, rows stay until
+    remove() is called, as the waiting pool does.
+    """
+
+    def __init__(self, capacity: int = 1024, max_rows: Optional[int] = None):
+        self._mood = np.zeros((capacity, len(MOOD_DIMS)), dtype=np.float32)
+        self._profile = np.zeros((capacity, len(PROFILE_DIMS)), dtype=np.float32)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._rows: Dict[str, int] = {}
+        self._fingerprints: "OrderedDict[str, int]" = OrderedDict()  # least recently upserted first
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self.max_rows = max_rows
+        self.featurized = 0  # rows (re)computed, for cache metrics
+        self.evicted = 0     # rows removed to stay within max_rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._rows
+
+    def _grow(self) -> None:
+        old = len(self._ids)
+        self._mood = np.vstack([self._mood, np.zeros_like(self._mood)])
+        self._profile = np.vstack([self._profile, np.zeros_like(self._profile)])
+        self._active = np.concatenate([self._active, np.zeros(old, dtype=bool)])
+        self._ids.extend([None] * old)
+        self._free.extend(range(2 * old - 1, old - 1, -1))
+
+    def upsert(self, entry: Dict[str, Any]) -> int:
+        """Add or refresh one peer; returns its row. Unchanged peers cost one hash."""
+        user_id = entry.get("user_id") or _profile(entry).get("user_id")
+        fingerprint = _fingerprint(entry)
+        row = self._rows.get(user_id)
+        if row is not None and self._fingerprints[user_id] == fingerprint:
+            self._fingerprints.move_to_end(user_id)
+            return row
+        if row is None:
+            if not self._free:
+                self._grow()
+            row = self._free.pop()
+            self._rows[user_id] = row
+            self._ids[row] = user_id
+            self._active[row] = True
+        self._mood[row] = mood_features(entry)
+        self._profile[row] = profile_features(entry)
+        self._fingerprints[user_id] = fingerprint
+        self._fingerprints.move_to_end(user_id)
+        self.featurized += 1
+        return row
+
+    def remove(self, user_id: str) -> bool:
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return False
+        del self._fingerprints[user_id]
+        self._mood[row] = 0
+        self._profile[row] = 0
+        self._active[row] = False
+        self._ids[row] = None
+        self._free.append(row)
+        return True
+
+    def sync(self, peers: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """Upsert `peers` and return their row indices"""
+        rows = np.fromiter((self.upsert(p) for p in peers), dtype=np.intp)
+        if self.max_rows is not None:
+            # The peers just synced are the most recent, so only older rows are evicted
+            for _ in range(len(self._rows) - max(self.max_rows, len(rows))):
+                self.remove(next(iter(self._fingerprints)))
+                self.evicted += 1
+        return rows
+
+    def score_rows(self, user_mood: np.ndarray, user_profile: np.ndarray, rows: Optional[np.ndarray] = None
+                   ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (rows, final, mood similarity, profile compatibility) for the given rows,
+        or for every active row; all scores on a 0-100 scale
+        """
+        if rows is None:
+            rows = np.flatnonzero(self._active)
+            mood_sim = (self._mood @ user_mood)[rows]
+            profile_sim = (self._profile @ user_profile)[rows]
+        else:
+            mood_sim = self._mood[rows] @ user_mood
+            profile_sim = self._profile[rows] @ user_profile
+        return (rows, *combine(mood_sim, profile_sim))
+
+    def features(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the (mood, profile) feature rows, safe to use off the event loop"""
+        return self._mood[rows], self._profile[rows]
+
+    def rank(self, user: Dict[str, Any], peers: Optional[Iterable[Dict[str, Any]]] = None, k: int = 10,
+             mood: Optional[Dict[str, Any]] = None) -> List[ScoredPeer]:
+        """
+        Best `k` peers for `user`, highest score first
+
+        With `peers`, only those are scored (and cached on the way); without,
+        the whole indexed pool is. The user is never ranked against themself.
+        The `peers` path fingerprints every entry in Python, so it costs
+        O(len(peers)) interpreter work (~200 ms at 100k); narrow large lists
+        first, as PeerMatcher does with the waiting pool's nearest candidates.
+        """
+        user_mood = mood_features(user, mood)
+        rows = self.sync(peers) if peers is not None else None
+        rows, final, mood_sim, profile_sim = self.score_rows(user_mood, profile_features(user), rows)
+        self_row = self._rows.get(user.get("user_id"))
+        if self_row is not None:
+            final = np.where(rows == self_row, -1.0, final)
+        if len(rows) > k:
+            top = np.argpartition(-final, k)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-final[top], kind="stable")]
+
+        ranked = []
+        for i in top:
+            if final[i] < 0:
+                continue
+            row = rows[i]
+            shared = [MOOD_DIMS[d] for d in range(_THEME_COUNT) if user_mood[d] > 0 and self._mood[row, d] > 0]
+            ranked.append(ScoredPeer(self._ids[row], int(round(float(final[i]))), int(round(float(mood_sim[i]))),
+                                     int(round(float(profile_sim[i]))), shared))
+        return ranked
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {"indexed_peers": len(self._rows), "capacity": len(self._ids), "featurized_rows": self.featurized,
+                "evicted_rows": self.evicted}
@@ -0,0 +1,149 @@
+"""
+Structured output parsing for model responses
+Turns a model reply into a validated pydantic model instead of a greedy
+regex + json.loads that throws away the whole call on any stray brace
+
+Used by LLMGateway.complete_structured(): the schema is sent as a forced
+tool so the model returns arguments that are already JSON; if a reply only
+has text, the JSON values in it are found with a linear balanced-brace
+scan and the first one that validates is used. Every outcome is counted in
+`parse_stats`.
+"""
+
+from typing import Any, Dict, Iterator, Optional, Type, TypeVar
+import json
+import re
+
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+_OPENERS = {"{": "}", "[": "]"}
+
+
+class StructuredOutputError(ValueError):
+    """A model reply could not be parsed or validated against its schema"""
+
+
+def iter_json(text: str) -> Iterator[Any]:
+    """
+    Yield each complete JSON object or array embedded in `text`, in order
+
+    Candidate values start at a top-level `{` or `[` and end where the
+    bracket depth returns to zero (brackets inside strings are ignored). A
+    candidate that isn't valid JSON is skipped and scanning continues after
+    it. A stray opener that is never closed (e.g. "scores [0-100:" before
+    the answer) would swallow the rest of the text, so if the text ends
+    inside a candidate the scan restarts just after that candidate's start.
+    Usually one pass; each unclosed opener costs one more pass over the tail.
+    """
+    position = 0
+    while position < len(text):
+        stack = []
+        start = None
+        in_string = False
+        escaped = False
+        for i in range(position, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+                continue
+            if ch == '"' and stack:
+                in_string = True
+            elif ch in _OPENERS:
+                if not stack:
+                    start = i
+                stack.append(_OPENERS[ch])
+            elif stack and ch == stack[-1]:
+                stack.pop()
+                if not stack:
+                    try:
+                        value = json.loads(text[start:i + 1])
+                    except ValueError:
+                        pass
+                    else:
+                        yield value
+                    start = None
+            elif stack and ch in "}]":
+                stack.clear()  # mismatched bracket: abandon this candidate
+                start = None
+        if start is None:
+            return
+        position = start + 1  # text ended inside a candidate: rescan after its opener
+
+
+def extract_json(text: str) -> Any:
+    """Return the first complete JSON object or array embedded in `text`"""
+    for value in iter_json(text):
+        return value
+    raise StructuredOutputError("No complete JSON value found in model response")
+
+
+def validate(data: Any, schema: Type[T]) -> T:
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        raise StructuredOutputError(f"Response does not match {schema.__name__}: {e}") from e
+
+
+def parse(text: str, schema: Type[T]) -> T:
+    """
+    The first JSON value in free-form response text that validates as `schema`
+
+    Stray values before the real answer (e.g. "see [1] then {...}") are
+    skipped rather than failing the reply.
+    """
+    error: Optional[StructuredOutputError] = None
+    for value in iter_json(text):
+        try:
+            return validate(value, schema)
+        except StructuredOutputError as e:
+            error = error or e  # report the first mismatch if nothing validates
+    raise error or StructuredOutputError("No complete JSON value found in model response")
+
+
+def tool_for(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """Anthropic tool definition whose input is `schema`"""
+    return {
+        "name": "record_" + re.sub(r"(?<!^)(?=[A-Z])", "_", schema.__name__).lower(),
+        "description": (schema.__doc__ or schema.__name__).strip(),
+        "input_schema": schema.model_json_schema()
+    }
+
+
+def repair_prompt(error: StructuredOutputError, schema: Type[BaseModel]) -> str:
+    return (
+        f"That response could not be used: {error}\n\n"
+        f"Reply with only a corrected JSON object matching this schema:\n"
+        f"{json.dumps(schema.model_json_schema())}"
+    )
+
+
+class ParseStats:
+    """Counts of structured-output outcomes, exported with the LLM metrics"""
+
+    def __init__(self):
+        self.calls = 0
+        self.tool_use = 0          # parsed from a tool_use block
+        self.text_fallback = 0     # parsed by scanning response text
+        self.repaired = 0          # first reply failed, repair retry succeeded
+        self.failures = 0          # still unusable after the repair retry
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "tool_use": self.tool_use,
+            "text_fallback": self.text_fallback,
+            "repaired": self.repaired,
+            "failures": self.failures,
+            "first_try_failure_rate": round((self.repaired + self.failures) / self.calls, 4) if self.calls else 0.0,
+            "parse_failure_rate": round(self.failures / self.calls, 4) if self.calls else 0.0
+        }
+
+
+parse_stats = ParseStats()
@@ -0,0 +1,257 @@
+"""
+Message Bus Transports
+How a root MessageBus shares its messages with the buses of other uvicorn
+worker processes
+
+InMemoryTransport (the default) keeps everything inside one process.
+UnixSocketTransport connects each worker to a small broker process over a
+Unix-domain socket; the broker fans every frame out to the other workers on
+the same channel, which record it and deliver it to the local session bus
+with the same session_id (so SafetyAgent sees every PROPOSAL of its session
+no matter which worker sent it).
+
+Frames are a 4-byte big-endian length followed by one AgentMessage.to_dict()
+JSON document. The first frame on a connection is a hello:
+{"channel": ..., "node": ...}.
+
+Run the broker before starting the workers:
+    python -m app.agents.transport [socket_path]
+
+Environment:
+    MESSAGE_BUS_TRANSPORT   "memory" (default) or "unix"
+    MESSAGE_BUS_SOCKET      Broker socket path (default /tmp/moodmatch-bus.sock)
+"""
+
+from typing import Dict, Any, Optional, Set, TYPE_CHECKING
+from collections import deque
+import asyncio
+import json
+import os
+import struct
+import time
+
+from .message_bus import AgentMessage, NODE_ID
+from app.logging_config import get_logger
+
+if TYPE_CHECKING:
+    from .message_bus import MessageBus
+
+_log = get_logger("bus.transport")
+
+DEFAULT_SOCKET_PATH = "/tmp/moodmatch-bus.sock"
+RETRY_MIN_SECONDS = 1.0    # first wait after the broker is found unreachable
+RETRY_MAX_SECONDS = 60.0   # waits double up to this
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+
+
+def encode_frame(record: Dict[str, Any]) -> bytes:
+    payload = json.dumps(record, separators=(",", ":"), default=str).encode("utf-8")
+    return _HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Read one frame's payload, or None once the peer has disconnected"""
+    try:
+        header = await reader.readexactly(_HEADER.size)
+        (length,) = _HEADER.unpack(header)
+        if length > MAX_FRAME_BYTES:
+            raise ValueError(f"frame of {length} bytes exceeds MAX_FRAME_BYTES")
+        return await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class InMemoryTransport:
+    """Messages stay in this process (single worker)"""
+
+    async def start(self, bus: "MessageBus") -> None:
+        pass
+
+    def publish(self, message: AgentMessage) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class UnixSocketTransport(InMemoryTransport):
+    """
+    Publish to, and receive from, the bus broker over a Unix-domain socket
+
+    Messages published before the connection is up (or while the broker is
+    unreachable) are buffered, up to `max_pending`, and flushed on connect.
+    If the broker is down the bus keeps working locally; start() then skips
+    reconnecting for a backoff that doubles from RETRY_MIN_SECONDS to
+    RETRY_MAX_SECONDS, and only the first failure is logged as a warning.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, channel: str = "default",
+                 max_pending: int = 10000):
+        self.path = path
+        self.channel = channel
+        self._pending: deque = deque(maxlen=max_pending)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self.published_count = 0
+        self.received_count = 0
+        self._retry_at = 0.0   # monotonic time before which start() doesn't reconnect
+        self._backoff = 0.0    # current wait; 0 while connected or never failed
+
+    @property
+    def connected(self) -> bool:
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def start(self, bus: "MessageBus") -> None:
+        """Connect to the broker and start feeding remote messages into `bus` (idempotent)"""
+        loop = asyncio.get_running_loop()
+        if self.connected and self._loop is loop:
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except OSError as e:
+            if not self._backoff:
+                _log.warning("⚠️ Bus broker unavailable at %s (%s); messages stay in this worker", self.path, e)
+            self._backoff = min(RETRY_MAX_SECONDS, self._backoff * 2 or RETRY_MIN_SECONDS)
+            self._retry_at = time.monotonic() + self._backoff
+            _log.debug("Bus broker retry in %.0fs", self._backoff)
+            return
+        self._backoff = self._retry_at = 0.0
+
+        self._loop = loop
+        self._writer = writer
+        writer.write(encode_frame({"channel": self.channel, "node": NODE_ID}))
+        while self._pending:
+            writer.write(self._pending.popleft())
+        self._reader_task = loop.create_task(self._read_loop(reader, bus))
+        _log.info("🔌 Connected to bus broker", extra={"fields": {"path": self.path, "channel": self.channel}})
+
+    def publish(self, message: AgentMessage) -> None:
+        frame = encode_frame(message.to_dict())
+        self.published_count += 1
+        if not self.connected:
+            self._pending.append(frame)
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._writer.write(frame)
+        else:
+            self._loop.call_soon_threadsafe(self._writer.write, frame)
+
+    async def _read_loop(self, reader: asyncio.StreamReader, bus: "MessageBus") -> None:
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    _log.warning("⚠️ Disconnected from bus broker at %s", self.path)
+                    break
+                self.received_count += 1
+                bus.receive_remote(AgentMessage.from_dict(json.loads(payload)))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _log.exception("❌ Bus transport reader failed")
+        finally:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def close(self) -> None:
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def transport_from_env(channel: str = "default") -> InMemoryTransport:
+    """Pick the transport named by MESSAGE_BUS_TRANSPORT"""
+    kind = os.getenv("MESSAGE_BUS_TRANSPORT", "memory").lower()
+    if kind == "unix":
+        return UnixSocketTransport(os.getenv("MESSAGE_BUS_SOCKET", DEFAULT_SOCKET_PATH), channel=channel)
+    if kind != "memory":
+        raise ValueError(f"Unknown MESSAGE_BUS_TRANSPORT: {kind}")
+    return InMemoryTransport()
+
+
+class BusBroker:
+    """
+    Fan-out broker: every frame a worker sends is forwarded, unparsed, to
+    the other workers connected on the same channel
+
+    Connections from the same node (process) never get each other's frames:
+    two root buses in one process on one channel are separate local buses,
+    and forwarding between them would record local traffic twice.
+
+    A worker whose socket buffer grows past `max_buffer_bytes` is too slow
+    to keep up and gets disconnected rather than stalling everyone else.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, max_buffer_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_buffer_bytes = max_buffer_bytes
+        self.channels: Dict[str, Set[asyncio.StreamWriter]] = {}
+        self._nodes: Dict[asyncio.StreamWriter, Optional[str]] = {}  # connection -> hello node
+        self.forwarded_count = 0
+
+    async def serve_forever(self) -> None:
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # stale socket from a previous broker
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        _log.info("📡 Bus broker listening on %s", self.path)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        hello = await read_frame(reader)
+        if hello is None:
+            writer.close()
+            return
+        hello = json.loads(hello)
+        channel = hello.get("channel", "default")
+        node = hello.get("node")
+        peers = self.channels.setdefault(channel, set())
+        peers.add(writer)
+        self._nodes[writer] = node
+        _log.info("🔌 Worker joined", extra={"fields": {"channel": channel, "node": hello.get("node"), "peers": len(peers)}})
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                frame = _HEADER.pack(len(payload)) + payload
+                for peer in list(peers):
+                    if peer is writer or (node is not None and self._nodes.get(peer) == node):
+                        continue
+                    if peer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+                        _log.warning("⚠️ Dropping slow worker on channel %s", channel)
+                        peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(frame)
+                    self.forwarded_count += 1
+        finally:
+            peers.discard(writer)
+            self._nodes.pop(writer, None)
+            writer.close()
+            _log.info("👋 Worker left", extra={"fields": {"channel": channel, "node": hello.get("node")}})
+
+
+# Run the broker: python -m app.agents.transport [socket_path]
+if __name__ == "__main__":
+    import sys
+    from app.logging_config import configure_logging
+
+    configure_logging()
+    broker = BusBroker(sys.argv[1] if len(sys.argv) > 1 else os.getenv("MESSAGE_BUS_SOCKET", DEFAULT_SOCKET_PATH))
+    try:
+        asyncio.run(broker.serve_forever())
+    except KeyboardInterrupt:
+        pass
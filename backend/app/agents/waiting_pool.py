@@ -0,0 +1,79 @@
+"""
+Waiting pool of peers available for matching
+A dict of user_id -> waiting entry that keeps the mood-text embedding index
+(and PeerMatcher's cached scoring rows) in step as peers join and leave
+
+Environment:
+    PEER_MATCH_CANDIDATES   Nearest peers PeerMatcher scores from a larger pool (default 200)
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional
+import os
+
+from .embedding_index import EmbeddingIndex
+from .scoring import ScoringEngine
+
+NEAREST_CANDIDATES = int(os.getenv("PEER_MATCH_CANDIDATES", "200"))
+
+
+def mood_text(entry: Dict[str, Any], mood: Optional[Dict[str, Any]] = None) -> str:
+    """The text a person is matched on: what they wrote, their focus and their analysed mood"""
+    profile = entry.get("profile") or entry
+    mood = mood or entry.get("mood_analysis") or {}
+    themes = mood.get("emotional_themes") or mood.get("themes") or []
+    parts = [
+        entry.get("user_input"), profile.get("mood_post"), profile.get("current_focus"),
+        mood.get("primary_emotion") or mood.get("emotion"), " ".join(str(t) for t in themes)
+    ]
+    return " ".join(str(p) for p in parts if p)
+
+
+class WaitingPool(MutableMapping):
+    """
+    user_id -> entry ({"profile", "mood_analysis", ...}), indexed for nearest-peer search
+
+    Assigning an entry (re)indexes it; deleting one removes it from the
+    index and from `scorer`. The pool has its own ScoringEngine: roster
+    profiles scored elsewhere share user_ids with waiting entries but not
+    their fields, and one engine would keep rebuilding rows between them.
+    """
+
+    def __init__(self, index: Optional[EmbeddingIndex] = None, scorer: Optional[ScoringEngine] = None):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.index = index or EmbeddingIndex()
+        self.scorer = scorer or ScoringEngine()
+
+    def __getitem__(self, user_id: str) -> Dict[str, Any]:
+        return self._entries[user_id]
+
+    def __setitem__(self, user_id: str, entry: Dict[str, Any]) -> None:
+        self._entries[user_id] = entry
+        self.index.add(user_id, mood_text(entry))
+
+    def __delitem__(self, user_id: str) -> None:
+        del self._entries[user_id]
+        self.index.remove(user_id)
+        self.scorer.remove(user_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Add many entries with a single index refit"""
+        self._entries.update(entries)
+        self.index.add_many((user_id, mood_text(entry)) for user_id, entry in entries.items())
+
+    def peer(self, user_id: str) -> Dict[str, Any]:
+        """Entry in the shape PeerMatcher expects (user_id included)"""
+        return {"user_id": user_id, **self._entries[user_id]}
+
+    def nearest(self, user: Dict[str, Any], k: int, mood: Optional[Dict[str, Any]] = None,
+                allow: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Up to `k` waiting peers whose mood text is closest to the user's, best first"""
+        exclude = (user.get("user_id"),) if user.get("user_id") else ()
+        hits = self.index.query(mood_text(user, mood), k, exclude=exclude, allow=allow)
+        return [self.peer(user_id) for user_id, _ in hits]
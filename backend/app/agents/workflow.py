@@ -0,0 +1,177 @@
+"""
+Dependency-graph workflow executor
+Describes a multi-agent run as named stages with declared inputs and runs
+every stage as soon as its inputs are ready
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from dataclasses import dataclass
+import asyncio
+import time
+
+from app.logging_config import get_logger
+
+_log = get_logger("workflow")
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One step of a workflow
+
+    `run` is awaited with one keyword argument per name in `inputs`; each
+    name is either another stage or a value passed to Workflow.run(). An
+    optional stage that raises yields None instead of failing the run.
+    """
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    inputs: Tuple[str, ...] = ()
+    optional: bool = False
+
+
+@dataclass
+class StageTiming:
+    status: str          # "done", "failed", "cancelled"
+    started_ms: float = 0.0
+    ms: float = 0.0
+
+
+@dataclass
+class WorkflowResult:
+    values: Dict[str, Any]
+    timings: Dict[str, StageTiming]
+    cancelled_by: Optional[str] = None   # stage whose result stopped the run
+    cancel_reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_reason is not None
+
+    def timings_summary(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {"status": t.status, "started_ms": round(t.started_ms, 1), "ms": round(t.ms, 1)}
+            for name, t in self.timings.items()
+        }
+
+
+class Workflow:
+    """
+    A DAG of stages
+
+    Adding a stage that is already present (same name, callable and inputs)
+    is a no-op, so a stage can never run twice in one execution; a different
+    stage under an existing name is an error.
+    """
+
+    def __init__(self, name: str, stages: Iterable[Stage] = ()):
+        self.name = name
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage: Stage) -> "Workflow":
+        existing = self.stages.get(stage.name)
+        if existing is not None:
+            if existing != stage:
+                raise ValueError(f"Stage '{stage.name}' is already defined differently in {self.name}")
+            _log.debug("Skipping duplicate stage %s", stage.name)
+            return self
+        self.stages[stage.name] = stage
+        return self
+
+    def order(self, provided: Iterable[str] = ()) -> List[str]:
+        """Stage names in dependency order; raises on unknown inputs or cycles"""
+        provided = set(provided)
+        ordered: List[str] = []
+        state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+        def visit(name: str, path: Tuple[str, ...]) -> None:
+            if state.get(name) == 2:
+                return
+            if state.get(name) == 1:
+                raise ValueError(f"Cycle in {self.name}: {' -> '.join(path + (name,))}")
+            state[name] = 1
+            for dep in self.stages[name].inputs:
+                if dep in self.stages:
+                    visit(dep, path + (name,))
+                elif dep not in provided:
+                    raise ValueError(f"Stage '{name}' needs '{dep}', which is neither a stage nor provided")
+            state[name] = 2
+            ordered.append(name)
+
+        for name in self.stages:
+            visit(name, ())
+        return ordered
+
+    async def run(self, provided: Optional[Dict[str, Any]] = None,
+                  cancel_when: Optional[Callable[[str, Any], Optional[str]]] = None,
+                  on_stage: Optional[Callable[[str, Any], None]] = None) -> WorkflowResult:
+        """
+        Execute the workflow
+
+        Args:
+            provided: Values available to stages as inputs
+            cancel_when: Called with (stage name, value) after each stage;
+                returning a reason cancels every stage that hasn't finished
+            on_stage: Called with (stage name, value) as each stage finishes,
+                e.g. to stream partial results
+        """
+        provided = dict(provided or {})
+        order = self.order(provided)
+        begin = time.perf_counter()
+        values: Dict[str, Any] = {}
+        timings: Dict[str, StageTiming] = {name: StageTiming("cancelled") for name in order}
+        tasks: Dict[str, asyncio.Task] = {}
+        stop: Dict[str, str] = {}
+
+        async def execute(stage: Stage) -> Any:
+            kwargs = {}
+            for dep in stage.inputs:
+                kwargs[dep] = await tasks[dep] if dep in tasks else provided[dep]
+            started = time.perf_counter()
+            timings[stage.name].started_ms = (started - begin) * 1000
+            try:
+                value = await stage.run(**kwargs)
+                status = "done"
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if not stage.optional:
+                    timings[stage.name].status = "failed"
+                    timings[stage.name].ms = (time.perf_counter() - started) * 1000
+                    for name, task in tasks.items():
+                        if name != stage.name and not task.done():
+                            task.cancel()
+                    raise
+                _log.warning("⚠️ Optional stage %s failed (continuing)", stage.name, exc_info=True)
+                value, status = None, "failed"
+            timings[stage.name].status = status
+            timings[stage.name].ms = (time.perf_counter() - started) * 1000
+            values[stage.name] = value
+            if on_stage is not None:
+                on_stage(stage.name, value)
+
+            reason = cancel_when(stage.name, value) if cancel_when else None
+            if reason and not stop:
+                stop.update(stage=stage.name, reason=reason)
+                _log.info("🛑 %s cancelled after %s: %s", self.name, stage.name, reason)
+                for name, task in tasks.items():
+                    if name != stage.name and not task.done():
+                        task.cancel()
+            return value
+
+        for name in order:
+            tasks[name] = asyncio.create_task(execute(self.stages[name]), name=f"{self.name}:{name}")
+        try:
+            outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        # Propagate the first real failure (cancellations caused by it are expected)
+        for name, outcome in zip(tasks, outcomes):
+            if isinstance(outcome, Exception) and not isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+
+        return WorkflowResult(values, timings, stop.get("stage"), stop.get("reason"))
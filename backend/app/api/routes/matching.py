@@ -4,37 +4,57 @@ Handles peer matching requests using demo student profiles.
 """
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, Optional
 from datetime import datetime
-import anthropic
+import asyncio
+import json
 import os
 
 from app.agents.multi_agent_coordinator import MultiAgentCoordinator
+from app.agents.mood_analyzer import MoodAnalyzer
 from app.agents.peer_matcher import PeerMatcher
 from app.agents.email_generator import EmailGenerator
 from app.agents.location_agent import LocationAgent
 from app.agents.message_bus import MessageBus
+from app.agents.waiting_pool import WaitingPool
+from app.agents.batch_matcher import BatchReport, run_batch, BATCH_INTERVAL
+from app.agents.llm_gateway import get_gateway
+from app.agents.fanout import Branch, fan_out, timings
+from app.agents.bu_resources import get_crisis_resources
 from app.demo_data import DEMO_STUDENT_PROFILES, get_student_by_id, get_all_students_except
+from app.logging_config import get_logger
 
 router = APIRouter()
+logger = get_logger("api.matching")
 
 # Initialize clients
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+llm = get_gateway()  # process-wide pooled client shared with /api/mood
 
-# Create a shared message bus for agents
-message_bus = MessageBus()
+# Shared message bus for /find-match; each request runs on its own session bus under it
+message_bus = MessageBus.from_env("matching")
 
-# Initialize agents with message_bus and clients
-coordinator = MultiAgentCoordinator(anthropic_client, None)
-peer_matcher = PeerMatcher(message_bus, anthropic_client, None)  # Takes 3 args
-email_generator = EmailGenerator(message_bus, anthropic_client)  # Takes 2 args only
-location_agent = LocationAgent(message_bus, anthropic_client)  # Takes 2 args only
+# Initialize the coordinator with clients
+coordinator = MultiAgentCoordinator(llm, None)
 
-# Use demo student profiles as waiting peers
-waiting_peers = {}
-for profile in DEMO_STUDENT_PROFILES:
-    waiting_peers[profile["user_id"]] = {
+# Post-match stage: per-branch time limits (seconds) and how the two intro
+# emails are written ("parallel" = two concurrent calls, "batched" = one call)
+LOCATION_TIMEOUT = float(os.getenv("FIND_MATCH_LOCATION_TIMEOUT", "20"))
+EMAIL_TIMEOUT = float(os.getenv("FIND_MATCH_EMAIL_TIMEOUT", "25"))
+EMAIL_MODE = os.getenv("FIND_MATCH_EMAIL_MODE", "parallel")
+
+DEFAULT_LOCATION = {
+    "location": "Mugar Library",
+    "reasoning": "Quiet study space",
+    "address": "771 Commonwealth Ave"
+}
+
+# Use demo student profiles as waiting peers; the pool keeps its embedding
+# index and scoring rows in sync as peers join and leave
+waiting_peers = WaitingPool()
+waiting_peers.load({
+    profile["user_id"]: {
         "profile": profile,
         "mood_analysis": {
             "primary_emotion": profile.get("mood_post", "")[:50],
@@ -51,6 +71,14 @@ for profile in DEMO_STUDENT_PROFILES:
         "timestamp": datetime.now().isoformat(),
         "added_at": datetime.now().isoformat()
     }
+    for profile in DEMO_STUDENT_PROFILES
+})
+
+# Batch pairing over the whole pool: on demand via /batch-match, and every
+# BATCH_MATCH_INTERVAL seconds when that is set
+latest_batch: Optional[BatchReport] = None
+_batch_lock = asyncio.Lock()
+_batch_task: Optional[asyncio.Task] = None
 
 
 class MoodEntryRequest(BaseModel):
@@ -63,21 +91,41 @@ class MatchRequest(BaseModel):
     mood_analysis: Dict
 
 
+def _profile_for(request: MoodEntryRequest) -> Dict:
+    """Demo profile for the user, or a minimal one built from the request"""
+    user_profile = get_student_by_id(request.user_id)
+    if not user_profile:
+        user_profile = {
+            "user_id": request.user_id,
+            "name": "Student",
+            "interests": [],
+            "mood_post": request.mood_text
+        }
+    return user_profile
+
+
+# Workflow stage -> SSE event name, for /analyze-mood/stream
+STREAM_EVENTS = {
+    "analysis": "mood_analysis",
+    "screening": "crisis_decision",
+    "match": "match",
+    "location": "location",
+    "email": "email",
+    "result": "done"
+}
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @router.post("/analyze-mood")
 async def analyze_mood(request: MoodEntryRequest):
     """
     Analyze user's mood entry and coordinate agents.
     """
     try:
-        # Get user profile
-        user_profile = get_student_by_id(request.user_id)
-        if not user_profile:
-            user_profile = {
-                "user_id": request.user_id,
-                "name": "Student",
-                "interests": [],
-                "mood_post": request.mood_text
-            }
+        user_profile = _profile_for(request)
         
         # Process through coordinator (now async!)
         result = await coordinator.process_mood_entry(
@@ -91,17 +139,50 @@ async def analyze_mood(request: MoodEntryRequest):
         return result
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("analyze-mood failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/analyze-mood/stream")
+async def analyze_mood_stream(request: MoodEntryRequest):
+    """
+    Same as /analyze-mood, but streams Server-Sent Events as each phase
+    finishes: mood_analysis, crisis_decision (with crisis resources when
+    needed), match, location, email and finally done (the full result).
+    """
+    user_profile = _profile_for(request)
+    
+    async def events():
+        try:
+            async for stage, value in coordinator.stream_match_request(request.mood_text, user_profile):
+                event = STREAM_EVENTS.get(stage)
+                if event is None:
+                    continue
+                if stage == "screening":
+                    value = {"crisis_detected": value["crisis"], "source": value["source"]}
+                    if value["crisis_detected"]:
+                        value["immediate_resources"] = get_crisis_resources()
+                elif stage == "result":
+                    value["user_profile"] = user_profile
+                yield _sse(event, value)
+        except Exception as e:
+            logger.exception("analyze-mood stream failed")
+            yield _sse("error", {"detail": str(e)})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.post("/find-match")
 async def find_match(request: MatchRequest):
     """
     Find a compatible peer match using profiles + mood.
     NOW WITH MULTI-AGENT COMMUNICATION AND VOTING!
     """
+    session_bus = None
     try:
         user_id = request.user_id
         mood_analysis = request.mood_analysis
@@ -138,6 +219,16 @@ async def find_match(request: MatchRequest):
             "user_input": mood_analysis.get("user_input", "")
         }
         
+        # Agents for this request only, bound to a session bus so concurrent
+        # requests never see each other's messages or internal state
+        session_bus = message_bus.session()
+        # Answers PeerMatcher's context and approval queries from the analysis the client sent
+        mood_analyzer = MoodAnalyzer(session_bus, llm)
+        mood_analyzer.internal_state["last_analysis"] = mood_analysis
+        peer_matcher = PeerMatcher(session_bus, llm, None, pool=waiting_peers)
+        email_generator = EmailGenerator(session_bus, llm)  # Takes 2 args only
+        location_agent = LocationAgent(session_bus, llm)  # Takes 2 args only
+        
         # Find match using PeerMatcher (MUST AWAIT since it's async!)
         match_result = await peer_matcher.find_match(
             user_profile=student_profile_for_matching,  # Changed from student_profile to user_profile
@@ -168,38 +259,51 @@ async def find_match(request: MatchRequest):
             "conversation_starters": match_result.get("conversation_starters", [])
         }
         
-        # Get location recommendation (simplified - just use defaults for now)
-        try:
-            location_recommendations = await location_agent.recommend_location(
+        # Location and emails fan out together; the emails are drafted with a
+        # placeholder for the meeting spot, filled in once the location is back.
+        # A branch that fails or times out gets its fallback.
+        matched_profile = matched_peer_data.get("profile", {})
+        location_branch = Branch(
+            "location",
+            location_agent.recommend_location(
                 mood_themes=mood_analysis.get("emotional_themes", []),
                 student_a=user_profile,
-                student_b=matched_peer_data.get("profile", {})
-            )
-        except Exception as e:
-            print(f"Error getting locations: {e}")
-            location_recommendations = {
-                "location": "Mugar Library",
-                "reasoning": "Quiet study space",
-                "address": "771 Commonwealth Ave"
-            }
+                student_b=matched_profile
+            ),
+            timeout=LOCATION_TIMEOUT,
+            fallback=DEFAULT_LOCATION
+        )
         
-        # Generate emails (simplified)
-        try:
-            email1 = await email_generator.generate_email(
-                user_profile=user_profile,
-                match_result=match_result,
-                location=location_recommendations
-            )
-            
-            email2 = await email_generator.generate_email(
-                user_profile=matched_peer_data.get("profile", {}),
-                match_result=match_result,
-                location=location_recommendations
+        if EMAIL_MODE == "batched":
+            results = await fan_out(location_branch, Branch(
+                "emails",
+                email_generator.generate_intro_emails(user_profile, matched_profile, match_result),
+                timeout=EMAIL_TIMEOUT,
+                fallback=lambda: (EmailGenerator.fallback_email(), EmailGenerator.fallback_email())
+            ))
+            email1, email2 = results["emails"].value
+        else:
+            results = await fan_out(
+                location_branch,
+                Branch(
+                    "email_user",
+                    email_generator.generate_email(user_profile=user_profile, match_result=match_result),
+                    timeout=EMAIL_TIMEOUT,
+                    fallback=EmailGenerator.fallback_email
+                ),
+                Branch(
+                    "email_peer",
+                    email_generator.generate_email(user_profile=matched_profile, match_result=match_result),
+                    timeout=EMAIL_TIMEOUT,
+                    fallback=EmailGenerator.fallback_email
+                )
             )
-        except Exception as e:
-            print(f"Error generating emails: {e}")
-            email1 = {"subject": "Match Found", "body": "You have a new match!", "tone": "warm"}
-            email2 = {"subject": "Match Found", "body": "You have a new match!", "tone": "warm"}
+            email1 = results["email_user"].value
+            email2 = results["email_peer"].value
+        location_recommendations = results["location"].value
+        email1 = EmailGenerator.fill_location(email1, location_recommendations)
+        email2 = EmailGenerator.fill_location(email2, location_recommendations)
+        stage_timings = timings(results)
         
         # Build response
         result = {
@@ -222,17 +326,72 @@ async def find_match(request: MatchRequest):
             "location_recommendations": location_recommendations,
             "email_preview": email1,
             "peer_email_preview": email2,
-            "safety_resources": match_result.get("safety_flag", False)
+            "safety_resources": match_result.get("safety_flag", False),
+            "negotiated": match_result.get("negotiated", False),
+            "approval_timed_out": match_result.get("approval_timed_out", False),
+            "stage_timings": stage_timings
         }
         
         return result
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("find-match failed")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if session_bus is not None:
+            session_bus.stop_delivery()
+
+
+async def _run_batch_pairing() -> BatchReport:
+    """One batch run at a time; the latest report is kept for /batch-match/latest"""
+    global latest_batch
+    async with _batch_lock:
+        latest_batch = await run_batch(message_bus, waiting_peers.scorer, waiting_peers)
+    return latest_batch
+
+
+async def _batch_pairing_loop():
+    while True:
+        await asyncio.sleep(BATCH_INTERVAL)
+        try:
+            await _run_batch_pairing()
+        except Exception:
+            logger.exception("Scheduled batch pairing failed")
+
+
+@router.on_event("startup")
+async def start_batch_pairing():
+    global _batch_task
+    if BATCH_INTERVAL > 0:
+        _batch_task = asyncio.create_task(_batch_pairing_loop(), name="batch-pairing")
+        logger.info("🧮 Batch pairing every %.0fs", BATCH_INTERVAL)
+
+
+@router.on_event("shutdown")
+async def stop_batch_pairing():
+    if _batch_task is not None:
+        _batch_task.cancel()
+
+
+@router.post("/batch-match")
+async def batch_match():
+    """Pair the whole waiting pool now (urgency-weighted, SafetyAgent-reviewed)"""
+    try:
+        report = await _run_batch_pairing()
+        return report.as_dict()
+    except Exception as e:
+        logger.exception("batch-match failed")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/batch-match/latest")
+async def latest_batch_match():
+    """Result of the most recent batch pairing run"""
+    if latest_batch is None:
+        return {"available": False}
+    return {"available": True, **latest_batch.as_dict()}
+
+
 @router.get("/waiting-peers")
 async def get_waiting_peers():
     """Get count and summary of waiting peers"""
@@ -257,5 +416,10 @@ async def get_system_stats():
         "waiting_peers": len(waiting_peers),
         "total_profiles": len(DEMO_STUDENT_PROFILES),
         "agents_active": 5,  # MoodAnalyzer, Coordinator, PeerMatcher, LocationAgent, EmailGenerator
-        "coordinator_stats": coordinator.get_statistics()
+        "coordinator_stats": coordinator.get_statistics(),
+        "find_match_bus_stats": message_bus.get_stats(),
+        "waiting_pool_index": waiting_peers.index.get_metrics(),
+        "waiting_pool_scoring": waiting_peers.scorer.get_metrics(),
+        "batch_matching": latest_batch.as_dict(include_pairs=False) if latest_batch else None,
+        "llm": llm.get_metrics()
     }
\ No newline at end of file
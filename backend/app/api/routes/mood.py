@@ -7,18 +7,17 @@ from fastapi import APIRouter, HTTPException
 from app.models.schemas import MoodEntry, MoodAnalysis, ResourceRecommendation
 from app.agents.multi_agent_coordinator import MultiAgentCoordinator
 from app.agents.bu_resources import get_crisis_resources, get_mental_health_resources
+from app.agents.llm_gateway import get_gateway
 from typing import List, Dict
-import anthropic
-import os
 
 router = APIRouter(prefix="/api/mood", tags=["mood"])
 
 # Initialize clients ONCE at module level
-anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+llm = get_gateway()  # process-wide pooled client shared with /api/matching
 
 # Initialize the multi-agent coordinator with clients
 # Pass None for supabase since we're using demo data
-coordinator = MultiAgentCoordinator(anthropic_client, None)
+coordinator = MultiAgentCoordinator(llm, None)
 
 @router.post("/analyze", response_model=Dict)
 async def analyze_mood(mood_entry: MoodEntry):
@@ -159,9 +158,11 @@ async def get_agent_statistics():
     - Communications by each agent
     - Collaboration events (queries between agents)
     - Crisis consultations
+    - LLM queue depth and wait times
     """
     try:
         stats = coordinator.get_statistics()
+        stats["llm"] = llm.get_metrics()
         return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching agent stats: {str(e)}")
\ No newline at end of file
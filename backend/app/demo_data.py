@@ -3,6 +3,8 @@ Demo Student Profiles - EXPANDED VERSION
 15 diverse BU student profiles for better multi-agent demonstration
 """
 
+from app.profile_store import ProfileStore
+
 DEMO_STUDENT_PROFILES = [
     # ============================================================================
     # ANANYA - The Main User (You!)
@@ -245,39 +247,25 @@ DEMO_STUDENT_PROFILES = [
     }
 ]
 
+# Indexed once at import; the helpers below are lookups, not scans of the roster
+PROFILE_STORE = ProfileStore(DEMO_STUDENT_PROFILES)
+
 def get_student_by_id(user_id: str):
     """Get a student profile by user_id"""
-    for profile in DEMO_STUDENT_PROFILES:
-        if profile["user_id"] == user_id:
-            return profile
-    return None
+    return PROFILE_STORE.get(user_id)
 
 def get_all_students_except(user_id: str):
     """Get all student profiles except the specified user"""
-    return [profile for profile in DEMO_STUDENT_PROFILES if profile["user_id"] != user_id]
+    return PROFILE_STORE.all_except(user_id)
 
 def get_students_by_focus(focus_keywords: list):
     """Get students who match certain focus areas"""
-    matching_students = []
-    for profile in DEMO_STUDENT_PROFILES:
-        current_focus = profile.get("current_focus", "").lower()
-        if any(keyword.lower() in current_focus for keyword in focus_keywords):
-            matching_students.append(profile)
-    return matching_students
+    return PROFILE_STORE.by_focus(focus_keywords)
+
+def find_students(interests: list = (), year: str = None, focus: list = ()):
+    """Get students matching every given interest, year and focus term"""
+    return PROFILE_STORE.query(interests=interests, year=year, focus=focus)
 
 def get_profile_summary():
     """Get a summary of all profiles for debugging"""
-    summary = {
-        "total_profiles": len(DEMO_STUDENT_PROFILES),
-        "by_year": {},
-        "by_focus_area": {}
-    }
-    
-    for profile in DEMO_STUDENT_PROFILES:
-        year = profile["year"]
-        summary["by_year"][year] = summary["by_year"].get(year, 0) + 1
-        
-        focus = profile["current_focus"]
-        summary["by_focus_area"][focus] = summary["by_focus_area"].get(focus, 0) + 1
-    
-    return summary
\ No newline at end of file
+    return PROFILE_STORE.summary()
@@ -0,0 +1,147 @@
+"""
+Structured, non-blocking logging for the agent system
+
+Agents and routes log through `get_logger(category)`. configure_logging()
+attaches a queue handler to the "moodmatch" logger, so the event loop thread
+only builds a LogRecord and enqueues it. Formatting and writing to stdout
+happen on a background QueueListener thread, which means terminal or pipe
+backpressure never shows up as request latency.
+
+Environment:
+    LOG_LEVEL      Root level for moodmatch loggers (default INFO)
+    LOG_FORMAT     "text" (default) or "json"
+    LOG_SAMPLING   Per-category sample rates for DEBUG/INFO records,
+                   e.g. "bus=0.1,agents.PeerMatcher=0.5" (agents log as
+                   agents.<agent_id>; names match case-insensitively).
+                   WARNING and above are never sampled out.
+"""
+
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+ROOT_LOGGER = "moodmatch"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger for a category such as "bus", "coordinator" or "agents.SafetyAgent" """
+    return logging.getLogger(f"{ROOT_LOGGER}.{category}")
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of DEBUG/INFO records for noisy categories"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix wins, so "agents.PeerMatcher" overrides "agents"
+        self.rates = sorted(
+            ((f"{ROOT_LOGGER}.{category}".lower(), rate) for category, rate in rates.items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        name = record.name.lower()
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return random.random() < rate
+        return True
+
+
+class _EnqueueOnlyHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers all formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class StructuredFormatter(logging.Formatter):
+    """Text or JSON lines; values passed as extra={"fields": {...}} become key=value pairs"""
+
+    def __init__(self, as_json: bool = False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "category": record.name[len(ROOT_LOGGER) + 1:] or record.name,
+            "message": record.getMessage(),
+            **fields
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if self.as_json:
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+        line = f"{entry['time']} {entry['level']:<7} [{entry['category']}] {entry['message']}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + entry["exception"]
+        return line
+
+
+def _parse_sampling(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            category, rate = part.split("=", 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(level: Optional[str] = None,
+                      sampling: Optional[Dict[str, float]] = None,
+                      as_json: Optional[bool] = None) -> None:
+    """Route moodmatch logs through a background queue listener (idempotent)"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    if sampling is None:
+        sampling = _parse_sampling(os.getenv("LOG_SAMPLING", ""))
+    if as_json is None:
+        as_json = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _EnqueueOnlyHandler(log_queue)
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(StructuredFormatter(as_json=as_json))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level.upper())
+    root.addHandler(queue_handler)
+    root.propagate = False
+    _queue_handler = queue_handler
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background listener"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
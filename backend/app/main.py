@@ -1,8 +1,13 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from app.logging_config import configure_logging, get_logger
+from app.agents.llm_gateway import close_gateway
+from app.agents.message_bus import close_env_buses
 
 load_dotenv()
+configure_logging()
+logger = get_logger("api")
 
 app = FastAPI(title="Mood Match API")
 
@@ -19,11 +24,14 @@ try:
     from app.api.routes import mood, matching
     app.include_router(mood.router, prefix="/api")  # ADD PREFIX HERE
     app.include_router(matching.router, prefix="/api")  # ADD PREFIX HERE
-    print("✅ All routes loaded successfully!")
-except Exception as e:
-    print(f"❌ Error loading routes: {e}")
-    import traceback
-    traceback.print_exc()
+    logger.info("✅ All routes loaded successfully!")
+except Exception:
+    logger.exception("❌ Error loading routes")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_gateway()
+    close_env_buses()  # flush queued log records and spill files before exit
 
 @app.get("/")
 def read_root():
@@ -2,7 +2,7 @@
 Pydantic models for Mood Match API
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict
 from datetime import datetime
 
@@ -15,12 +15,15 @@ class MoodEntry(BaseModel):
 
 class MoodAnalysis(BaseModel):
     """Result from mood analyzer agent"""
+    model_config = ConfigDict(extra="allow")  # keep any extra fields the model returns
+    
     primary_emotion: str
     urgency_level: str  # CRISIS, HIGH, MODERATE, LOW
-    needs: List[str]
-    matching_criteria: Dict
-    crisis_detected: bool
-    recommended_resources: List[str]
+    emotional_themes: List[str] = []
+    needs: List[str] = []
+    matching_criteria: Dict = {}
+    crisis_detected: bool = False
+    recommended_resources: List[str] = []
 
 class PeerProfile(BaseModel):
     """Profile for matching"""
@@ -32,12 +35,46 @@ class PeerProfile(BaseModel):
 
 class MatchResult(BaseModel):
     """Result from peer matcher agent"""
+    model_config = ConfigDict(extra="allow")
+    
     match_found: bool
-    matched_peer_id: Optional[str]
-    match_score: int  # 0-100
+    matched_peer_id: Optional[str] = None
+    match_score: int = 0  # 0-100
+    mood_similarity_score: Optional[int] = None
+    profile_compatibility_score: Optional[int] = None
+    rationale: str = ""
+    shared_emotional_themes: List[str] = []
+    conversation_starters: List[str] = []
+    safety_flag: bool = False
+
+class MatchExplanation(BaseModel):
+    """Why a locally scored match fits, from peer matcher agent"""
+    model_config = ConfigDict(extra="allow")
+    
     rationale: str
-    conversation_starters: List[str]
-    safety_flag: bool
+    conversation_starters: List[str] = []
+
+class LocationRecommendation(BaseModel):
+    """Result from location agent"""
+    model_config = ConfigDict(extra="allow")
+    
+    location: str
+    reasoning: str = ""
+    address: str = ""
+    alternative_locations: List = []
+
+class IntroEmail(BaseModel):
+    """Introduction email from email generator agent"""
+    model_config = ConfigDict(extra="allow")
+    
+    subject: str
+    body: str
+    tone: str = "warm"
+
+class IntroEmailPair(BaseModel):
+    """Both students' introduction emails, written in one call"""
+    email_a: IntroEmail
+    email_b: IntroEmail
 
 class ConversationMessage(BaseModel):
     """Message in a peer support conversation"""
@@ -48,12 +85,14 @@ class ConversationMessage(BaseModel):
 
 class FacilitationResponse(BaseModel):
     """Response from conversation facilitator"""
+    model_config = ConfigDict(extra="allow")
+    
     intervention_needed: bool
-    intervention_type: Optional[str]
-    message_to_participants: Optional[str]
-    suggested_resources: List[str]
-    crisis_detected: bool
-    conversation_health: str
+    intervention_type: Optional[str] = None
+    message_to_participants: Optional[str] = None
+    suggested_resources: List[str] = []
+    crisis_detected: bool = False
+    conversation_health: str = "unknown"
 
 class ResourceRecommendation(BaseModel):
     """BU resource recommendation"""
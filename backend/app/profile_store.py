@@ -0,0 +1,147 @@
+"""
+Indexed store of student profiles
+Built once from a roster; answers lookups by user_id, interest, year and
+current focus without scanning every profile
+
+Indexes:
+    user_id        hash map to the profile's position in the roster
+    interests      token -> positions  (e.g. "basketball", "pop" from "K-pop")
+    year           token -> positions  (e.g. "junior", "science")
+    current_focus  token -> positions
+
+Queries combine postings with set intersection and return profiles in
+roster order.
+"""
+
+from collections import Counter, defaultdict
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+import re
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+INDEXED_FIELDS = ("interests", "year", "current_focus")
+
+
+def tokenize(value: Any) -> Set[str]:
+    if isinstance(value, (list, tuple, set)):
+        return {token for item in value for token in tokenize(item)}
+    return set(_TOKEN.findall(str(value or "").lower()))
+
+
+class ProfileStore:
+    """Read-only roster of profiles with a user_id hash index and per-field inverted indexes"""
+
+    def __init__(self, profiles: Iterable[Dict[str, Any]]):
+        self.profiles: List[Dict[str, Any]] = list(profiles)
+        self._positions: Dict[str, int] = {}
+        self._index: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._by_year = Counter()
+        self._by_focus = Counter()
+
+        for position, profile in enumerate(self.profiles):
+            self._positions.setdefault(profile["user_id"], position)  # first wins, as with a scan
+            for field in INDEXED_FIELDS:
+                for token in tokenize(profile.get(field)):
+                    self._index[field][token].add(position)
+            self._by_year[profile.get("year")] += 1
+            self._by_focus[profile.get("current_focus")] += 1
+
+        # Postings are only read from here on; freeze them so callers can't corrupt an index
+        self._index = {
+            field: {token: frozenset(positions) for token, positions in postings.items()}
+            for field, postings in self._index.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.profiles)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._positions
+
+    def _profiles_at(self, positions: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.profiles[i] for i in sorted(positions)]
+
+    # Lookups -----------------------------------------------------------
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        position = self._positions.get(user_id)
+        return self.profiles[position] if position is not None else None
+
+    def all_except(self, user_id: str) -> List[Dict[str, Any]]:
+        position = self._positions.get(user_id)
+        if position is None:
+            return list(self.profiles)
+        return self.profiles[:position] + self.profiles[position + 1:]
+
+    def postings(self, field: str, term: str) -> FrozenSet[int]:
+        """Positions whose `field` contains every token of `term`"""
+        index = self._index[field]
+        tokens = tokenize(term)
+        if not tokens:
+            return frozenset()
+        result = None
+        for token in sorted(tokens, key=lambda t: len(index.get(t, ()))):  # rarest first
+            positions = index.get(token, frozenset())
+            result = positions if result is None else result & positions
+            if not result:
+                return frozenset()
+        return result
+
+    def _substring_postings(self, field: str, keyword: str) -> Set[int]:
+        """
+        Positions whose `field` contains `keyword` as a substring
+
+        Candidates come from the vocabulary (tokens containing each keyword
+        word) rather than the roster; only those are checked against the text.
+        """
+        index = self._index[field]
+        keyword = keyword.lower()
+        words = _TOKEN.findall(keyword)
+        if not words:  # punctuation-only or empty keyword: nothing to look up
+            return {i for i, p in enumerate(self.profiles) if keyword in str(p.get(field, "")).lower()}
+        candidates: Optional[Set[int]] = None
+        for word in words:
+            matching: Set[int] = set()
+            for token, positions in index.items():
+                if word in token:
+                    matching |= positions
+            candidates = matching if candidates is None else candidates & matching
+            if not candidates:
+                return set()
+        return {i for i in candidates if keyword in str(self.profiles[i].get(field, "")).lower()}
+
+    def by_focus(self, keywords: Iterable[str]) -> List[Dict[str, Any]]:
+        """Profiles whose current_focus contains any of `keywords` (case-insensitive substring)"""
+        matched: Set[int] = set()
+        for keyword in keywords:
+            matched |= self._substring_postings("current_focus", keyword)
+        return self._profiles_at(matched)
+
+    def query(self, interests: Iterable[str] = (), year: Optional[str] = None,
+              focus: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """
+        Profiles matching every given criterion
+
+        Each interest and focus term must match (all of its tokens present in
+        that field); `year` matches on its tokens, e.g. "junior" or "computer science".
+        """
+        sets: List[FrozenSet[int]] = [self.postings("interests", term) for term in interests]
+        if year:
+            sets.append(self.postings("year", year))
+        sets.extend(self.postings("current_focus", term) for term in focus)
+        if not sets:
+            return list(self.profiles)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for positions in sets[1:]:
+            result &= positions
+            if not result:
+                break
+        return self._profiles_at(result)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total_profiles": len(self.profiles),
+            "by_year": dict(self._by_year),
+            "by_focus_area": dict(self._by_focus)
+        }
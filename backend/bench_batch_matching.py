@@ -0,0 +1,83 @@
+"""
+Benchmark for batch pairing of the waiting pool
+
+Builds pools of 1k / 2k / 5k synthetic waiting peers (demo profiles with
+shuffled interests, mood posts and urgency levels), pairs each pool in one
+batch run including SafetyAgent review over a MessageBus, and compares the
+result with per-request greedy matching (each peer in turn takes its best
+remaining partner).
+
+Run from backend/:  python bench_batch_matching.py
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import asyncio
+import random
+
+import numpy as np
+
+from app.agents.batch_matcher import URGENCY_WEIGHTS, run_batch
+from app.agents.message_bus import MessageBus
+from app.agents.scoring import ScoringEngine, combine, MIN_MATCH_SCORE
+from app.demo_data import DEMO_STUDENT_PROFILES
+
+URGENCY = ["LOW", "MODERATE", "MODERATE", "MODERATE", "HIGH"]
+
+
+def make_pool(n: int, seed: int = 11):
+    rng = random.Random(seed)
+    interests = sorted({i for p in DEMO_STUDENT_PROFILES for i in p["interests"]})
+    pool = {}
+    for i in range(n):
+        base = DEMO_STUDENT_PROFILES[i % len(DEMO_STUDENT_PROFILES)]
+        other = DEMO_STUDENT_PROFILES[rng.randrange(len(DEMO_STUDENT_PROFILES))]
+        profile = dict(base, user_id=f"peer_{i}", interests=rng.sample(interests, 4),
+                       mood_post=f"{base['mood_post']} {other['current_focus']}")
+        pool[profile["user_id"]] = {
+            "profile": profile,
+            "mood_analysis": {"primary_emotion": "seeking support", "urgency_level": rng.choice(URGENCY)}
+        }
+    return pool
+
+
+def sequential_baseline(engine: ScoringEngine, pool) -> float:
+    """Total urgency-weighted score when peers are matched one request at a time"""
+    ids = list(pool)
+    rows = engine.sync({"user_id": user_id, **entry} for user_id, entry in pool.items())
+    mood, profile = engine.features(rows)
+    urgency = np.array([URGENCY_WEIGHTS[pool[u]["mood_analysis"]["urgency_level"]] for u in ids], dtype=np.float32)
+    free = np.ones(len(ids), dtype=bool)
+    total = 0.0
+    for i in range(len(ids)):
+        if not free[i]:
+            continue
+        free[i] = False
+        final, _, _ = combine(mood @ mood[i], profile @ profile[i])
+        final = np.where(free & (final >= MIN_MATCH_SCORE), final * (urgency + urgency[i]) / 2, -np.inf)
+        j = int(np.argmax(final))
+        if np.isfinite(final[j]):
+            free[j] = False
+            total += float(final[j])
+    return total
+
+
+async def main():
+    print(f"{'pool':>6} | {'pairs':>5} | {'objections':>10} | {'pairing (ms)':>12} | {'review (ms)':>11} | "
+          f"{'total (ms)':>10} | {'users/s':>8} | {'weight vs per-request':>21}")
+    print("-" * 104)
+    for n in (1_000, 2_000, 5_000):
+        pool = make_pool(n)
+        engine = ScoringEngine()
+        report = await run_batch(MessageBus(), engine, pool)
+        summary = report.as_dict(include_pairs=False)
+        batch_weight = sum(p.weight for p in report.pairs)
+        baseline = sequential_baseline(engine, pool)
+        print(f"{n:>6,} | {len(report.pairs):>5} | {summary['safety_objections']:>10} | "
+              f"{report.pairing_ms:>12.1f} | {report.review_ms:>11.1f} | {report.total_ms:>10.1f} | "
+              f"{summary['throughput']['users_per_second']:>8.0f} | {batch_weight / baseline:>20.3f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
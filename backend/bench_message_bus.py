@@ -0,0 +1,79 @@
+"""
+Microbenchmark for MessageBus.get_messages_for
+
+Fills a bus with 10k / 100k / 1M retained messages and measures how long an
+agent takes to fetch its handful of unread messages, compared with the old
+full-history scan.
+
+Run from backend/:  python bench_message_bus.py
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import contextlib
+import os
+import time
+from datetime import datetime, timedelta
+
+from app.agents.message_bus import MessageBus, AgentMessage, MessageType
+
+AGENTS = ["MoodAnalyzer", "PeerMatcher", "LocationAgent", "SafetyAgent", "EmailGenerator", "Coordinator"]
+TYPES = list(MessageType)
+UNREAD = 20
+LOOKUPS = 200
+
+
+def fill_bus(n: int) -> MessageBus:
+    """Post n messages (1 in 4 a broadcast) with strictly increasing timestamps"""
+    bus = MessageBus()
+    start = datetime.now() - timedelta(seconds=n)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(n):
+            receiver = "ALL" if i % 4 == 0 else AGENTS[i % len(AGENTS)]
+            bus.send(AgentMessage(
+                sender=AGENTS[(i + 1) % len(AGENTS)],
+                receiver=receiver,
+                message_type=TYPES[i % len(TYPES)],
+                content={"summary": f"message {i}"},
+                timestamp=start + timedelta(microseconds=i),
+                message_id=f"bench_{i}"
+            ))
+    return bus
+
+
+def legacy_scan(bus: MessageBus, agent_id: str, since: datetime):
+    """The pre-index implementation: filter the whole history"""
+    return [
+        m for m in bus.messages
+        if (m.receiver == agent_id or m.receiver == "ALL")
+        and (since is None or m.timestamp > since)
+    ]
+
+
+def time_per_call(fn, repeat: int) -> float:
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - begin) / repeat * 1e6  # microseconds
+
+
+def main():
+    print(f"{'retained':>10} | {'unread':>6} | {'indexed (us)':>12} | {'full scan (us)':>14} | {'speedup':>8}")
+    print("-" * 64)
+    for n in (10_000, 100_000, 1_000_000):
+        bus = fill_bus(n)
+        agent = "SafetyAgent"
+        # Position the agent's read cursor so roughly UNREAD messages are new to it
+        since = bus.messages[-UNREAD * 2].timestamp
+
+        indexed = bus.get_messages_for(agent, since=since)
+        assert [m.message_id for m in indexed] == [m.message_id for m in legacy_scan(bus, agent, since)]
+
+        indexed_us = time_per_call(lambda: bus.get_messages_for(agent, since=since), LOOKUPS)
+        scan_us = time_per_call(lambda: legacy_scan(bus, agent, since), max(1, LOOKUPS // (n // 10_000)))
+        print(f"{n:>10,} | {len(indexed):>6} | {indexed_us:>12.1f} | {scan_us:>14.1f} | {scan_us / indexed_us:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
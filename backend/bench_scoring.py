@@ -0,0 +1,78 @@
+"""
+Benchmark for the vectorized peer scoring engine
+
+Indexes 1k / 10k / 100k synthetic waiting peers (demo profiles with shuffled
+interests and mood posts) and measures one ranking of the whole pool, plus
+the per-request path where the caller passes its peer list and cached rows
+are reused. Only the whole-pool ranking stays in milliseconds at 100k: the
+list path fingerprints each peer in Python, so it grows linearly (~200 ms).
+
+Run from backend/:  python bench_scoring.py
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import random
+import time
+
+from app.agents.scoring import ScoringEngine
+from app.demo_data import DEMO_STUDENT_PROFILES
+
+RANKINGS = 50
+TOP_K = 10
+
+
+def make_peers(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    interests = sorted({i for p in DEMO_STUDENT_PROFILES for i in p["interests"]})
+    peers = []
+    for i in range(n):
+        base = DEMO_STUDENT_PROFILES[i % len(DEMO_STUDENT_PROFILES)]
+        other = DEMO_STUDENT_PROFILES[rng.randrange(len(DEMO_STUDENT_PROFILES))]
+        profile = dict(base, user_id=f"peer_{i}", interests=rng.sample(interests, 4),
+                       mood_post=f"{base['mood_post']} {other['current_focus']}")
+        peers.append({
+            "user_id": profile["user_id"],
+            "profile": profile,
+            "mood_analysis": {"primary_emotion": "seeking support", "urgency_level": "MODERATE"}
+        })
+    return peers
+
+
+def ms_per_call(fn, repeat: int) -> float:
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - begin) / repeat * 1000
+
+
+def main():
+    user = {
+        "user_id": "student_ananya",
+        "profile": DEMO_STUDENT_PROFILES[0],
+        "mood_analysis": {"primary_emotion": "anxious", "emotional_themes": ["career", "graduation"]},
+        "user_input": "Anxious about job applications and finishing my thesis"
+    }
+    print(f"{'peers':>8} | {'index (s)':>9} | {'rank pool (ms)':>14} | {'rank list, cached (ms)':>22} | best")
+    print("-" * 84)
+    for n in (1_000, 10_000, 100_000):
+        peers = make_peers(n)
+        engine = ScoringEngine()
+
+        begin = time.perf_counter()
+        engine.sync(peers)
+        index_s = time.perf_counter() - begin
+
+        pool_ms = ms_per_call(lambda: engine.rank(user, k=TOP_K), RANKINGS)
+        list_ms = ms_per_call(lambda: engine.rank(user, peers, k=TOP_K), max(1, RANKINGS // (n // 1_000)))
+        assert engine.featurized == n, "cached rows were recomputed"
+
+        best = engine.rank(user, k=TOP_K)[0]
+        print(f"{n:>8,} | {index_s:>9.2f} | {pool_ms:>14.2f} | {list_ms:>22.2f} | "
+              f"{best.user_id} ({best.match_score}: mood {best.mood_similarity_score}, "
+              f"profile {best.profile_compatibility_score})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark: messages delivered per request, with and without subscriptions
+
+Replays the message flow of one coordination run (mood broadcast, decision
+notifications, PeerMatcher's context and approval queries, the match
+proposal) through a session's agents and counts how many messages the bus
+pushes into agent inboxes. "Before" gives every agent the old catch-all
+subscription; "after" uses each agent's declared subscriptions.
+
+Run from backend/:  python bench_subscriptions.py
+"""
+
+import sys
+sys.path.insert(0, '.')
+
+import asyncio
+
+from app.agents.message_bus import MessageBus, MessageType, ALL_MESSAGES
+from app.agents.multi_agent_coordinator import AgentTeam
+
+
+async def replay_request(catch_all: bool):
+    bus = MessageBus().session()
+    team = AgentTeam(bus, anthropic_client=None, supabase_client=None)
+    if catch_all:
+        for agent_id in bus.agents:
+            bus.subscribers[agent_id] = ALL_MESSAGES
+    await bus.start_delivery()
+
+    analysis = {"primary_emotion": "overwhelmed", "urgency_level": "MODERATE", "emotional_themes": ["career"]}
+    team.mood_analyzer.internal_state["last_analysis"] = analysis
+    team.mood_analyzer.broadcast(MessageType.BROADCAST, {"summary": "User emotion: overwhelmed", "analysis": analysis})
+    team.mood_analyzer.log_decision("Classified as MODERATE urgency", "Primary emotion 'overwhelmed' detected", 0.85)
+
+    await team.peer_matcher.request("MoodAnalyzer", {"question": "What is the user's urgency level and emotional state?"})
+    await team.peer_matcher.request("MoodAnalyzer", {"question": "Do you approve?", "match_score": 85, "requesting_approval": True})
+    match = {"matched_peer_id": "student_marcus", "match_score": 85}
+    team.peer_matcher.broadcast(MessageType.PROPOSAL, {"summary": "Proposing match", "match": match})
+    team.peer_matcher.log_decision("Matched with student_marcus", "Score 85%", 0.85)
+    team.location_agent.log_decision("Recommended: Mugar Library", "Quiet study space", 0.9)
+
+    await bus.drain()
+    per_agent = {agent_id: 0 for agent_id in bus.agents}
+    for message in bus.messages:
+        for agent in bus._recipients(message):
+            per_agent[agent.agent_id] += 1
+    bus.stop_delivery()
+    return len(bus.messages), bus.delivered_count, per_agent
+
+
+async def main():
+    sent, before, before_by_agent = await replay_request(catch_all=True)
+    _, after, after_by_agent = await replay_request(catch_all=False)
+
+    print(f"Messages sent per request:      {sent}")
+    print(f"Deliveries before (catch-all):  {before}")
+    print(f"Deliveries after (subscribed):  {after}  ({(1 - after / before) * 100:.0f}% fewer)")
+    print()
+    print(f"{'agent':<16} | {'before':>6} | {'after':>5}")
+    print("-" * 34)
+    for agent_id in before_by_agent:
+        print(f"{agent_id:<16} | {before_by_agent[agent_id]:>6} | {after_by_agent[agent_id]:>5}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())